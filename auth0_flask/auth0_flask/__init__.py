@@ -0,0 +1,5 @@
+from .auth import Auth, AuthError, default_error_body
+from .jwks import JWKSCache, JWKSError, fetch_jwks
+from .keys import PEMKeys, StaticKeys
+from .permissions import Permissions, Requirement, permission_bits
+from .token_cache import TokenCache
@@ -0,0 +1,191 @@
+from functools import wraps
+
+from flask import jsonify, request
+from jose import jwt
+
+from .jwks import JWKSCache, JWKSError
+from .permissions import Permissions, Requirement, permission_bits
+from .token_cache import TokenCache
+
+'''
+Auth
+    bearer token authentication of a Flask API against an Auth0 tenant
+
+    auth = Auth('tenant.auth0.com', 'my-api', permissions=PERMISSIONS)
+
+    @app.route('/drinks', methods=['POST'])
+    @auth.requires_auth('post:drinks')
+    def post_drinks(payload):
+        ...
+
+    keys        the key provider (see keys.py), by default the JWKS of
+                the tenant cached by kid (jwks.py)
+    permissions the permissions of the API known in advance, each one
+                gets a bit so endpoints check them with a mask test
+    token_cache_size
+                how many verified tokens are kept (token_cache.py),
+                0 verifies every request
+    error_body  error_body(code, description, status_code) builds the
+                JSON body of the error responses, by default
+                {"code": code, "description": description}
+'''
+
+
+class AuthError(Exception):
+    def __init__(self, error, status_code):
+        self.error = error
+        self.status_code = status_code
+
+
+def default_error_body(code, description, status_code):
+    return {
+        'code': code,
+        'description': description
+    }
+
+
+class Auth:
+    def __init__(self, domain, audience, keys=None, algorithms=('RS256',),
+                 permissions=(), token_cache_size=1024,
+                 error_body=default_error_body):
+        self.domain = domain
+        self.audience = audience
+        self.issuer = 'https://' + domain + '/'
+        self.keys = keys if keys is not None else \
+            JWKSCache(f'https://{domain}/.well-known/jwks.json')
+        self.algorithms = list(algorithms)
+        self.permission_bits = permission_bits(permissions)
+        self.token_cache = TokenCache(token_cache_size)
+        self.error_body = error_body
+
+    def error(self, code, description, status_code):
+        return AuthError(self.error_body(code, description, status_code),
+                         status_code)
+
+    def get_token_auth_header(self):
+        '''
+        Obtains the Access Token from the Authorization Header
+        '''
+        auth = request.headers.get('Authorization', None)
+        if not auth:
+            raise self.error('authorization_header_missing',
+                             'Authorization header is expected.', 401)
+
+        parts = auth.split()
+        if not parts or parts[0].lower() != 'bearer':
+            raise self.error('invalid_header',
+                             'Authorization header must start with "Bearer".',
+                             401)
+        elif len(parts) == 1:
+            raise self.error('invalid_header', 'Token not found.', 401)
+        elif len(parts) > 2:
+            raise self.error('invalid_header',
+                             'Authorization header must be bearer token.', 401)
+
+        return parts[1]
+
+    def decode_jwt(self, token):
+        '''the payload of a token signed by a key of self.keys'''
+        try:
+            unverified_header = jwt.get_unverified_header(token)
+        except Exception:
+            raise self.error('invalid_header',
+                             'Unable to parse authentication token.', 400)
+        if 'kid' not in unverified_header:
+            raise self.error('invalid_header', 'Authorization malformed.', 401)
+
+        try:
+            key = self.keys.get_key(unverified_header['kid'])
+        except JWKSError:
+            raise self.error('jwks_unavailable',
+                             'Unable to fetch the signing keys.', 503)
+        if key is None:
+            raise self.error('invalid_header',
+                             'Unable to find the appropriate key.', 400)
+
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=self.algorithms,
+                audience=self.audience,
+                issuer=self.issuer
+            )
+        except jwt.ExpiredSignatureError:
+            raise self.error('token_expired', 'Token expired.', 401)
+        except jwt.JWTClaimsError:
+            raise self.error('invalid_claims',
+                             'Incorrect claims. Please, check the audience '
+                             'and issuer.', 401)
+        except Exception:
+            raise self.error('invalid_header',
+                             'Unable to parse authentication token.', 400)
+
+    def verify_token(self, token):
+        '''
+        (payload, Permissions) of a token, both cached in token_cache so a
+        token seen before is neither verified nor converted again
+        '''
+        verified = self.token_cache.get(token)
+        if verified is None:
+            payload = self.decode_jwt(token)
+            verified = (payload,
+                        Permissions.of(payload, self.permission_bits))
+            self.token_cache.put(token, payload, verified)
+        return verified
+
+    def verify_decode_jwt(self, token):
+        payload, _ = self.verify_token(token)
+        return payload
+
+    def requirement(self, all_of=(), any_of=()):
+        return Requirement(all_of, any_of, self.permission_bits)
+
+    def check_permissions(self, permission, payload):
+        '''
+        permission: a permission string or a Requirement
+        payload: a decoded payload or its Permissions (None when the
+                 payload has no permissions claim)
+        '''
+        requirement = permission if isinstance(permission, Requirement) \
+            else self.requirement([permission])
+        if not requirement:
+            return True
+
+        permissions = payload if payload is None or \
+            isinstance(payload, Permissions) else \
+            Permissions.of(payload, self.permission_bits)
+        if permissions is None:
+            raise self.error('invalid_claims',
+                             'Permissions not included in JWT.', 400)
+        if not requirement.allows(permissions):
+            raise self.error('permission_denied',
+                             'you do not have permissions', 401)
+        return True
+
+    def requires_auth(self, *permissions, any_of=()):
+        '''
+        @requires_auth('post:drinks', 'patch:drinks') needs both permissions,
+        @requires_auth(any_of=('patch:drinks', 'delete:drinks')) one of them,
+        @requires_auth() or @requires_auth only a valid token
+
+        the decorated view gets the verified payload as first argument,
+        failures are answered with the error body as JSON
+        '''
+        if len(permissions) == 1 and callable(permissions[0]):
+            return self.requires_auth()(permissions[0])
+        requirement = self.requirement(permissions, any_of)
+
+        def requires_auth_decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                try:
+                    token = self.get_token_auth_header()
+                    payload, granted = self.verify_token(token)
+                    self.check_permissions(requirement, granted)
+                except AuthError as ae:
+                    return jsonify(ae.error), ae.status_code
+                return f(payload, *args, **kwargs)
+
+            return wrapper
+        return requires_auth_decorator
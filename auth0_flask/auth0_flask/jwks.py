@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+'''
+JWKSCache
+    the signing keys of a JSON Web Key Set, fetched once and kept by kid
+    instead of downloading the key set for every authenticated request
+
+    get_key(kid)
+        returns the key with that kid, or None when the key set has none
+        - keys older than ttl seconds are fetched again, in the
+          background refresher when it runs, else on the next request
+        - an unknown kid (the provider rotated its keys) triggers a fetch
+        - requests fetch at most once every min_refresh_interval seconds,
+          so tokens with made up kids or an unreachable provider cannot
+          make every request wait for a fetch
+        - when a fetch fails the keys already known are kept and served
+          for up to max_stale seconds (stale-if-error), JWKSError is
+          raised when there are none
+
+    start_background_refresh()
+        fetches the keys every refresh_interval seconds in a daemon thread,
+        so requests never wait for the provider once the keys are loaded.
+        with background_refresh=True the first get_key() starts it, so
+        importing an app neither fetches nor starts a thread
+'''
+
+
+class JWKSError(Exception):
+    pass
+
+
+def fetch_jwks(url, timeout):
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class JWKSCache:
+    def __init__(self, url, ttl=600, refresh_interval=300,
+                 min_refresh_interval=30, max_stale=86400, timeout=5,
+                 fetch=fetch_jwks, clock=time.monotonic,
+                 background_refresh=False):
+        self.url = url
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.max_stale = max_stale
+        self.timeout = timeout
+        self.fetch = fetch
+        self.clock = clock
+        self.background_refresh = background_refresh
+
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._lock = threading.Lock()
+        self._refresher = None
+
+        self.hits = 0
+        self.fetches = 0
+        self.failures = 0
+
+    def _fetch_keys(self):
+        '''the keys of the key set by kid, None when the fetch failed'''
+        self.fetches += 1
+        try:
+            jwks = self.fetch(self.url, self.timeout)
+            return {key['kid']: key for key in jwks['keys'] if 'kid' in key}
+        except Exception:
+            self.failures += 1
+            return None
+
+    def _store(self, keys, attempted_at):
+        self._attempted_at = attempted_at
+        if keys is not None:
+            self._keys = keys
+            self._fetched_at = self.clock()
+
+    def refresh(self):
+        '''fetches the key set without blocking the requests meanwhile'''
+        attempted_at = self.clock()
+        keys = self._fetch_keys()
+        with self._lock:
+            self._store(keys, attempted_at)
+        return keys is not None
+
+    def get_key(self, kid):
+        if self.background_refresh and self._refresher is None:
+            self.start_background_refresh()
+        # requests arriving during a fetch wait for it instead of
+        # fetching the same key set again
+        with self._lock:
+            now = self.clock()
+            stale = self._fetched_at is None or \
+                now - self._fetched_at >= self.ttl
+            may_fetch = self._attempted_at is None or \
+                now - self._attempted_at >= self.min_refresh_interval
+            if may_fetch and (stale or kid not in self._keys):
+                self._store(self._fetch_keys(), now)
+
+            if self._fetched_at is None or \
+                    now - self._fetched_at >= self.max_stale:
+                raise JWKSError('unable to fetch the key set from ' + self.url)
+
+            key = self._keys.get(kid)
+            if key is not None:
+                self.hits += 1
+            return key
+
+    def start_background_refresh(self):
+        with self._lock:
+            if self._refresher is not None or not self.refresh_interval:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop,
+                                               name='jwks-refresh',
+                                               daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            self.refresh()
+            time.sleep(self.refresh_interval)
+
+    def stats(self):
+        return {
+            'keys': len(self._keys),
+            'hits': self.hits,
+            'fetches': self.fetches,
+            'failures': self.failures
+        }
@@ -0,0 +1,36 @@
+'''
+Key providers: where Auth gets the key that verifies a token
+
+A provider has one method, get_key(kid), returning the verification key
+of that key id in a form jose's jwt.decode() takes (a JWK dict or a PEM
+string), or None when it has no such key. It may raise JWKSError when
+its keys cannot be loaded at all.
+
+    JWKSCache   (jwks.py) the key set of the identity provider, fetched
+                over HTTP and cached by kid, the one to use with Auth0
+    PEMKeys     public keys read once from PEM files, for deployments
+                that pin the signing key instead of fetching it
+    StaticKeys  keys held in memory, for tests and benchmarks that sign
+                their own tokens (see testing.py)
+'''
+
+
+class StaticKeys:
+    def __init__(self, keys=None):
+        # {kid: JWK dict or PEM string}
+        self.keys = dict(keys or {})
+
+    def add(self, kid, key):
+        self.keys[kid] = key
+
+    def get_key(self, kid):
+        return self.keys.get(kid)
+
+
+class PEMKeys(StaticKeys):
+    def __init__(self, paths):
+        # {kid: path of a PEM encoded public key}
+        super().__init__()
+        for kid, path in paths.items():
+            with open(path) as pem:
+                self.add(kid, pem.read())
@@ -0,0 +1,76 @@
+'''
+Permission sets of verified tokens and the requirements of the endpoints
+
+    Permissions.of(payload, bits)
+        the permissions claim of a payload as an immutable set plus a
+        bitmask over the permissions registered by the app, built once
+        per token (Auth caches it with the verified payload), None when
+        the claim is missing
+
+    Requirement(all_of, any_of, bits)
+        what an endpoint asks for, compiled once when requires_auth
+        decorates it: every permission of all_of and at least one of
+        any_of when given. registered permissions are checked with a
+        single mask test, others against the set
+
+    bits is the {permission: bit} dict of permission_bits(), the
+    registry of the permissions an API knows in advance
+'''
+
+
+def permission_bits(names):
+    return {name: 1 << bit for bit, name in enumerate(names)}
+
+
+def mask_of(names, bits):
+    mask = 0
+    for name in names:
+        mask |= bits.get(name, 0)
+    return mask
+
+
+class Permissions:
+    __slots__ = ('names', 'mask')
+
+    def __init__(self, names, bits=None):
+        self.names = frozenset(names)
+        self.mask = mask_of(self.names, bits or {})
+
+    @classmethod
+    def of(cls, payload, bits=None):
+        names = payload.get('permissions')
+        if not isinstance(names, (list, tuple)):
+            return None
+        return cls((name for name in names if isinstance(name, str)), bits)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __repr__(self):
+        return f'<Permissions {sorted(self.names)}>'
+
+
+class Requirement:
+    __slots__ = ('all_mask', 'all_rest', 'any_mask', 'any_rest', 'any')
+
+    def __init__(self, all_of=(), any_of=(), bits=None):
+        bits = bits or {}
+        all_of = frozenset(name for name in all_of if name)
+        any_of = frozenset(name for name in any_of if name)
+        self.all_mask = mask_of(all_of, bits)
+        self.all_rest = all_of.difference(bits)
+        self.any_mask = mask_of(any_of, bits)
+        self.any_rest = any_of.difference(bits)
+        self.any = bool(any_of)
+
+    def __bool__(self):
+        return bool(self.all_mask or self.all_rest or self.any)
+
+    def allows(self, permissions):
+        if permissions.mask & self.all_mask != self.all_mask or \
+                not self.all_rest <= permissions.names:
+            return False
+        if self.any:
+            return bool(permissions.mask & self.any_mask) or \
+                not self.any_rest.isdisjoint(permissions.names)
+        return True
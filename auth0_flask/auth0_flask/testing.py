@@ -0,0 +1,92 @@
+'''
+RS256 keys and tokens made locally, so tests and benchmarks never need
+the identity provider
+
+    key = SigningKey()
+    auth = Auth(domain, audience, keys=StaticKeys({key.kid: key.jwk()}))
+    token = key.token(auth, permissions=['post:drinks'])
+'''
+import base64
+import time
+import uuid
+
+from jose import jwk, jwt
+
+# RSA key generation: pycryptodome or python-rsa
+try:
+    from Crypto.PublicKey import RSA
+except ImportError:
+    RSA = None
+try:
+    import rsa
+except ImportError:
+    rsa = None
+
+
+def generate_private_pem(bits=2048):
+    if RSA is not None:
+        return RSA.generate(bits).exportKey('PEM').decode('ascii')
+    if rsa is not None:
+        _, private_key = rsa.newkeys(bits)
+        return private_key.save_pkcs1().decode('ascii')
+    raise RuntimeError('pycryptodome or rsa is needed to generate keys')
+
+
+def public_numbers(private_pem):
+    '''the modulus n and public exponent e of a private key'''
+    if RSA is not None:
+        key = RSA.importKey(private_pem)
+    elif rsa is not None:
+        key = rsa.PrivateKey.load_pkcs1(private_pem.encode('ascii'))
+    else:
+        raise RuntimeError('pycryptodome or rsa is needed to read keys')
+    return key.n, key.e
+
+
+def base64url_uint(value):
+    # RFC 7518 6.3.1: big endian, no leading zero byte, no padding
+    data = value.to_bytes((value.bit_length() + 7) // 8 or 1, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class SigningKey:
+    '''a new RSA signing key with a random kid'''
+
+    def __init__(self, bits=2048):
+        self.kid = uuid.uuid4().hex
+        self.private_pem = generate_private_pem(bits)
+
+    def public_pem(self):
+        public = jwk.construct(self.private_pem, 'RS256').public_key()
+        pem = public.to_pem()
+        return pem.decode('ascii') if isinstance(pem, bytes) else pem
+
+    def jwk(self):
+        '''
+        the public key as a JWK, as served in a JSON Web Key Set, built
+        from n and e since python-jose-cryptodome keys have no to_dict()
+        '''
+        n, e = public_numbers(self.private_pem)
+        return {
+            'kty': 'RSA',
+            'alg': 'RS256',
+            'use': 'sig',
+            'kid': self.kid,
+            'n': base64url_uint(n),
+            'e': base64url_uint(e)
+        }
+
+    def token(self, auth, permissions=(), ttl=3600, **claims):
+        '''a token signed for the issuer and audience of auth'''
+        now = int(time.time())
+        payload = {
+            'iss': auth.issuer,
+            'sub': 'test|' + uuid.uuid4().hex,
+            'aud': auth.audience,
+            'iat': now,
+            'exp': now + ttl,
+            'permissions': list(permissions)
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self.private_pem, algorithm='RS256',
+                          headers={'kid': self.kid})
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+'''
+TokenCache
+    payloads of tokens that passed verification, so a client reusing
+    its bearer token does not pay for parsing and the RSA signature
+    check on every request
+
+    entries are keyed by the SHA-256 of the token (the token itself is
+    never kept), hold at most maxsize tokens in least recently used
+    order, and are dropped as soon as the token expires (exp) or when
+    it is not valid yet (nbf). tokens without exp are not cached.
+
+    put(token, payload, value) caches value instead of the payload, so
+    what is derived from the payload (e.g. its permission set) is kept
+    with it and expires with the token
+'''
+
+
+class TokenCache:
+    def __init__(self, maxsize=1024, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        '''the cached value of a still valid token, else None'''
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, not_before = entry
+                now = self.clock()
+                if now >= expires_at:
+                    del self._entries[key]
+                elif not_before is None or now >= not_before:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, token, payload, value=None):
+        expires_at = payload.get('exp')
+        if not self.maxsize or not isinstance(expires_at, (int, float)):
+            return
+        not_before = payload.get('nbf')
+        if not isinstance(not_before, (int, float)):
+            not_before = None
+
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (payload if value is None else value,
+                                  expires_at, not_before)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,103 @@
+'''
+Requests per second through Auth.requires_auth
+
+    python benchmark.py [--requests 2000] [--clients 50]
+
+Tokens are signed with an RS256 key generated on the fly and requests go
+through the Flask test client, so neither Auth0 nor a server is needed.
+Every key provider is measured with and without the token cache, next
+to a view without authentication as the baseline.
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import Flask
+
+from auth0_flask import Auth, JWKSCache, PEMKeys, StaticKeys
+from auth0_flask.testing import SigningKey
+
+DOMAIN = 'benchmark.auth0.com'
+AUDIENCE = 'benchmark'
+PERMISSIONS = ('get:drinks-detail', 'post:drinks')
+
+
+def make_app(auth):
+    app = Flask(__name__)
+
+    @app.route('/public')
+    def public():
+        return 'ok'
+
+    @app.route('/private')
+    @auth.requires_auth('get:drinks-detail')
+    def private(payload):
+        return 'ok'
+
+    return app
+
+
+def requests_per_second(client, path, headers):
+    for header in headers[:50]:
+        client.get(path, headers=header)
+    start = time.perf_counter()
+    for header in headers:
+        response = client.get(path, headers=header)
+        assert response.status_code == 200, response.get_data()
+    return len(headers) / (time.perf_counter() - start)
+
+
+def key_providers(key, directory):
+    public = key.jwk()
+    yield 'in memory', StaticKeys({key.kid: public})
+
+    path = os.path.join(directory, 'public.pem')
+    with open(path, 'w') as pem:
+        pem.write(key.public_pem())
+    yield 'PEM file', PEMKeys({key.kid: path})
+
+    # the cached key set of a provider, fetched from memory here
+    yield 'JWKS', JWKSCache('memory://jwks',
+                            fetch=lambda url, timeout: {'keys': [public]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=50,
+                        help='clients, each reusing its own token')
+    args = parser.parse_args()
+
+    key = SigningKey()
+    rng = random.Random(0)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, keys in key_providers(key, directory):
+            for cache_size in (0, 1024):
+                auth = Auth(DOMAIN, AUDIENCE, keys=keys,
+                            permissions=PERMISSIONS,
+                            token_cache_size=cache_size)
+                tokens = [key.token(auth, ['get:drinks-detail'])
+                          for _ in range(args.clients)]
+                headers = [{'Authorization': 'Bearer ' + rng.choice(tokens)}
+                           for _ in range(args.requests)]
+                client = make_app(auth).test_client()
+                if not rows:
+                    rows.append(('none (baseline)', '-', '%.0f' %
+                                 requests_per_second(client, '/public',
+                                                     headers)))
+                rows.append((name, 'on' if cache_size else 'off', '%.0f' %
+                             requests_per_second(client, '/private', headers)))
+
+    print(f'requests/s, {args.requests} requests from {args.clients} clients')
+    header = ('key provider', 'token cache', 'requests/s')
+    widths = [max(len(str(x)) for x in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print('  '.join(str(x).rjust(w) for x, w in zip(row, widths)))
+
+
+if __name__ == '__main__':
+    main()
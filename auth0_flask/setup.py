@@ -0,0 +1,11 @@
+from setuptools import setup
+
+setup(
+    name='auth0-flask',
+    version='0.1.0',
+    description='Auth0 bearer token authentication for Flask APIs',
+    packages=['auth0_flask'],
+    python_requires='>=3.7',
+    # jose comes from the app: python-jose or python-jose-cryptodome
+    install_requires=['Flask'],
+)
@@ -0,0 +1,327 @@
+import unittest
+
+from flask import Flask, jsonify
+from jose import jwt
+
+from auth0_flask import (Auth, JWKSCache, JWKSError, Permissions, Requirement,
+                         StaticKeys, TokenCache, permission_bits)
+from auth0_flask.testing import SigningKey
+
+URL = 'https://tenant.auth0.com/.well-known/jwks.json'
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProvider:
+    '''a JWKS endpoint serving the kids in self.kids, or failing'''
+
+    def __init__(self, *kids):
+        self.kids = list(kids)
+        self.down = False
+        self.requests = 0
+
+    def __call__(self, url, timeout):
+        self.requests += 1
+        if self.down:
+            raise OSError('connection refused')
+        return {'keys': [{'kid': kid, 'kty': 'RSA'} for kid in self.kids]}
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """Tests for the key set cache, with a fake provider and clock"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.provider = FakeProvider('a')
+        self.cache = JWKSCache(URL, ttl=600, min_refresh_interval=30,
+                               max_stale=3600, fetch=self.provider,
+                               clock=self.clock)
+
+    def test_keys_are_cached_until_ttl(self):
+        self.assertEqual(self.cache.get_key('a')['kid'], 'a')
+        self.clock.now += 599
+        self.assertEqual(self.cache.get_key('a')['kid'], 'a')
+        self.assertEqual(self.provider.requests, 1)
+
+        # expired keys are fetched again
+        self.provider.kids = ['b']
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get_key('a'))
+        self.assertEqual(self.cache.get_key('b')['kid'], 'b')
+        self.assertEqual(self.provider.requests, 2)
+
+    def test_unknown_kid_fetches_at_most_every_min_refresh_interval(self):
+        self.cache.get_key('a')
+        # the provider rotated its keys
+        self.provider.kids = ['a', 'b']
+        self.clock.now += 29
+        self.assertIsNone(self.cache.get_key('b'))
+        self.assertEqual(self.provider.requests, 1)
+
+        self.clock.now += 1
+        self.assertEqual(self.cache.get_key('b')['kid'], 'b')
+        self.assertEqual(self.provider.requests, 2)
+
+        # made up kids do not make every request fetch
+        for _ in range(10):
+            self.assertIsNone(self.cache.get_key('unknown'))
+        self.assertEqual(self.provider.requests, 2)
+
+    def test_stale_keys_are_served_while_the_provider_is_down(self):
+        self.cache.get_key('a')
+        self.provider.down = True
+        self.clock.now += 600
+        self.assertEqual(self.cache.get_key('a')['kid'], 'a')
+        self.assertEqual(self.cache.stats()['failures'], 1)
+
+        # until max_stale seconds after the last successful fetch
+        self.clock.now += 2999
+        self.assertEqual(self.cache.get_key('a')['kid'], 'a')
+        self.clock.now += 1
+        with self.assertRaises(JWKSError):
+            self.cache.get_key('a')
+
+        # the keys are back as soon as the provider is
+        self.provider.down = False
+        self.clock.now += 30
+        self.assertEqual(self.cache.get_key('a')['kid'], 'a')
+
+    def test_provider_down_without_keys(self):
+        self.provider.down = True
+        with self.assertRaises(JWKSError):
+            self.cache.get_key('a')
+
+    def test_refresh(self):
+        self.cache.get_key('a')
+        self.provider.kids = ['b']
+        self.assertTrue(self.cache.refresh())
+        self.assertEqual(self.cache.get_key('b')['kid'], 'b')
+
+        # a failed refresh keeps the keys
+        self.provider.down = True
+        self.assertFalse(self.cache.refresh())
+        self.assertEqual(self.cache.get_key('b')['kid'], 'b')
+
+
+    def test_background_refresh_starts_with_the_first_request(self):
+        self.assertIsNone(self.cache._refresher)
+        self.cache.get_key('a')
+        # off unless asked for
+        self.assertIsNone(self.cache._refresher)
+
+        cache = JWKSCache(URL, fetch=self.provider, clock=self.clock,
+                          background_refresh=True)
+        self.assertIsNone(cache._refresher)
+        self.assertEqual(cache.get_key('a')['kid'], 'a')
+        self.assertTrue(cache._refresher.daemon)
+        self.assertTrue(cache._refresher.is_alive())
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """Tests for the verified token cache, with a fake clock"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TokenCache(maxsize=2, clock=self.clock)
+
+    def test_expired_tokens_are_dropped(self):
+        self.cache.put('token', {'sub': 'a', 'exp': 1010})
+        self.assertEqual(self.cache.get('token'), {'sub': 'a', 'exp': 1010})
+        self.clock.now = 1009.9
+        self.assertIsNotNone(self.cache.get('token'))
+        self.clock.now = 1010
+        self.assertIsNone(self.cache.get('token'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_tokens_not_valid_yet_are_not_served(self):
+        self.cache.put('token', {'exp': 1100, 'nbf': 1050})
+        self.assertIsNone(self.cache.get('token'))
+        # the entry stays for when the token becomes valid
+        self.assertEqual(self.cache.stats()['size'], 1)
+        self.clock.now = 1050
+        self.assertIsNotNone(self.cache.get('token'))
+
+    def test_tokens_without_exp_are_not_cached(self):
+        self.cache.put('token', {'sub': 'a'})
+        self.cache.put('other', {'sub': 'a', 'exp': 'never'})
+        self.assertIsNone(self.cache.get('token'))
+        self.assertIsNone(self.cache.get('other'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put('a', {'exp': 2000})
+        self.cache.put('b', {'exp': 2000})
+        self.cache.get('a')
+        self.cache.put('c', {'exp': 2000})
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_value_and_stats(self):
+        self.cache.put('token', {'exp': 2000}, value=('payload', 'bits'))
+        self.assertEqual(self.cache.get('token'), ('payload', 'bits'))
+        self.assertIsNone(self.cache.get('unknown'))
+        self.assertEqual(self.cache.stats(), {
+            'size': 1, 'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+        # maxsize = 0 turns the cache off
+        cache = TokenCache(maxsize=0, clock=self.clock)
+        cache.put('token', {'exp': 2000})
+        self.assertIsNone(cache.get('token'))
+
+
+class RequirementTestCase(unittest.TestCase):
+    """Tests for the permission checks of the endpoints"""
+
+    def setUp(self):
+        self.bits = permission_bits(('get:drinks-detail', 'post:drinks',
+                                     'patch:drinks', 'delete:drinks'))
+
+    def permissions(self, *names):
+        return Permissions.of({'permissions': list(names)}, self.bits)
+
+    def test_all_of(self):
+        requirement = Requirement(['post:drinks', 'patch:drinks'],
+                                  bits=self.bits)
+        self.assertTrue(requirement.allows(
+            self.permissions('post:drinks', 'patch:drinks')))
+        self.assertTrue(requirement.allows(
+            self.permissions('post:drinks', 'patch:drinks', 'other')))
+        self.assertFalse(requirement.allows(self.permissions('post:drinks')))
+        self.assertFalse(requirement.allows(self.permissions()))
+
+    def test_any_of(self):
+        requirement = Requirement(any_of=['patch:drinks', 'delete:drinks'],
+                                  bits=self.bits)
+        self.assertTrue(requirement.allows(self.permissions('patch:drinks')))
+        self.assertTrue(requirement.allows(self.permissions('delete:drinks')))
+        self.assertFalse(requirement.allows(self.permissions('post:drinks')))
+        self.assertFalse(requirement.allows(self.permissions()))
+
+    def test_all_of_and_any_of(self):
+        requirement = Requirement(['get:drinks-detail'],
+                                  ['patch:drinks', 'delete:drinks'],
+                                  bits=self.bits)
+        self.assertTrue(requirement.allows(
+            self.permissions('get:drinks-detail', 'delete:drinks')))
+        self.assertFalse(requirement.allows(
+            self.permissions('get:drinks-detail')))
+        self.assertFalse(requirement.allows(
+            self.permissions('patch:drinks', 'delete:drinks')))
+
+    def test_unregistered_permissions(self):
+        # permissions outside the registry are checked against the set
+        requirement = Requirement(['read:menu'], ['a', 'post:drinks'],
+                                  bits=self.bits)
+        self.assertTrue(requirement.allows(
+            self.permissions('read:menu', 'a')))
+        self.assertTrue(requirement.allows(
+            self.permissions('read:menu', 'post:drinks')))
+        self.assertFalse(requirement.allows(self.permissions('read:menu')))
+        self.assertFalse(requirement.allows(
+            self.permissions('a', 'post:drinks')))
+
+    def test_empty_requirement(self):
+        self.assertFalse(Requirement(bits=self.bits))
+        self.assertFalse(Requirement([''], bits=self.bits))
+        self.assertTrue(Requirement(['post:drinks'], bits=self.bits))
+        self.assertTrue(Requirement(bits=self.bits).allows(self.permissions()))
+
+    def test_permissions_of(self):
+        self.assertIsNone(Permissions.of({}, self.bits))
+        self.assertIsNone(Permissions.of({'permissions': 'post:drinks'}))
+        permissions = Permissions.of(
+            {'permissions': ['post:drinks', 1, 'other']}, self.bits)
+        self.assertEqual(permissions.names, {'post:drinks', 'other'})
+        self.assertEqual(permissions.mask, self.bits['post:drinks'])
+
+
+class RequiresAuthTestCase(unittest.TestCase):
+    """End to end tests of requires_auth, from the header to the response"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = SigningKey()
+
+    def setUp(self):
+        self.auth = Auth('tenant.auth0.com', 'coffee-shop',
+                         keys=StaticKeys({self.key.kid: self.key.jwk()}),
+                         permissions=['post:drinks', 'delete:drinks'])
+        app = Flask(__name__)
+
+        @app.route('/drinks', methods=['POST'])
+        @self.auth.requires_auth('post:drinks')
+        def post_drinks(payload):
+            return jsonify({'sub': payload['sub']})
+
+        self.client = app.test_client()
+
+    def post(self, authorization=None):
+        headers = {} if authorization is None else \
+            {'Authorization': authorization}
+        res = self.client.post('/drinks', headers=headers)
+        return res.status_code, res.get_json()
+
+    def bearer(self, **kwargs):
+        return 'Bearer ' + self.key.token(self.auth, **kwargs)
+
+    def test_allowed(self):
+        token = self.key.token(self.auth, permissions=['post:drinks'],
+                               sub='test|barista')
+        self.assertEqual(self.post('Bearer ' + token),
+                         (200, {'sub': 'test|barista'}))
+        # a repeated token comes from the token cache
+        self.assertEqual(self.post('Bearer ' + token)[0], 200)
+        self.assertEqual(self.auth.token_cache.stats()['hits'], 1)
+
+    def test_header_errors(self):
+        self.assertEqual(self.post(), (401, {
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'}))
+        for header in ('Basic abc', 'Bearer', 'Bearer a b'):
+            status, body = self.post(header)
+            self.assertEqual((status, body['code']), (401, 'invalid_header'))
+
+    def test_decode_errors(self):
+        status, body = self.post('Bearer not-a-token')
+        self.assertEqual((status, body['code']), (400, 'invalid_header'))
+
+        # signed by a key the provider does not have
+        other = SigningKey()
+        status, body = self.post('Bearer ' + other.token(self.auth))
+        self.assertEqual(status, 400)
+        self.assertEqual(body['description'],
+                         'Unable to find the appropriate key.')
+
+        status, body = self.post(self.bearer(permissions=['post:drinks'],
+                                             ttl=-10))
+        self.assertEqual((status, body['code']), (401, 'token_expired'))
+
+        status, body = self.post(self.bearer(permissions=['post:drinks'],
+                                             aud='other-api'))
+        self.assertEqual((status, body['code']), (401, 'invalid_claims'))
+
+    def test_permission_errors(self):
+        status, body = self.post(self.bearer(permissions=['delete:drinks']))
+        self.assertEqual((status, body['code']), (401, 'permission_denied'))
+
+        # a token without the permissions claim
+        token = jwt.encode({'iss': self.auth.issuer, 'aud': self.auth.audience,
+                            'sub': 'test|barista'},
+                           self.key.private_pem, algorithm='RS256',
+                           headers={'kid': self.key.kid})
+        status, body = self.post('Bearer ' + token)
+        self.assertEqual((status, body), (400, {
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'}))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,305 @@
+#----------------------------------------------------------------------------#
+# Analytics.
+#
+# Rollup tables for the dashboards (shows per month per state, top artists
+# by upcoming bookings, venue utilization). The rollups are kept up to date
+# incrementally from Show insert/update/delete events and Venue state
+# changes, and can be rebuilt from scratch with a single streaming pass over
+# the Show table. Set based writes (query.update() / query.delete(), psql)
+# bypass the events: run POST /analytics/rebuild after them.
+#----------------------------------------------------------------------------#
+
+import datetime
+from collections import Counter
+
+import dateutil.parser
+from flask import Blueprint, current_app, jsonify, request, abort
+from sqlalchemy import and_, bindparam, event, func, select, text
+from sqlalchemy.orm.attributes import get_history
+
+# number of Show rows fetched per round trip while rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+
+def _as_date(value):
+    # Show.start_time may still hold the raw form string right after insert
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return dateutil.parser.parse(value).date()
+
+
+def _month(day):
+    return day.strftime('%Y-%m')
+
+
+class Analytics:
+    '''
+    Analytics(app, db, Venue, Artist, Show)
+        defines the rollup models, hooks them to Show insert/update/delete
+        and Venue state changes and registers the /analytics endpoints on the app
+    '''
+
+    def __init__(self, app, db, Venue, Artist, Show):
+        self.db = db
+        self.Venue = Venue
+        self.Artist = Artist
+        self.Show = Show
+
+        class ShowMonthStateRollup(db.Model):
+            __tablename__ = 'ShowMonthStateRollup'
+
+            month = db.Column(db.String(7), primary_key=True)
+            state = db.Column(db.String(120), primary_key=True)
+            show_count = db.Column(db.Integer, nullable=False, default=0)
+
+        class ArtistDayRollup(db.Model):
+            __tablename__ = 'ArtistDayRollup'
+
+            artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
+            day = db.Column(db.Date, primary_key=True)
+            show_count = db.Column(db.Integer, nullable=False, default=0)
+
+        class VenueDayRollup(db.Model):
+            __tablename__ = 'VenueDayRollup'
+
+            venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
+            day = db.Column(db.Date, primary_key=True)
+            show_count = db.Column(db.Integer, nullable=False, default=0)
+
+        self.ShowMonthStateRollup = ShowMonthStateRollup
+        self.ArtistDayRollup = ArtistDayRollup
+        self.VenueDayRollup = VenueDayRollup
+
+        event.listen(Show, 'after_insert', self._after_show_insert)
+        event.listen(Show, 'after_delete', self._after_show_delete)
+        event.listen(Show, 'before_update', self._before_show_update)
+        event.listen(Venue, 'before_update', self._before_venue_update)
+
+        app.register_blueprint(self._blueprint())
+
+    #  Incremental maintenance
+    #  ----------------------------------------------------------------
+
+    def _rollup_keys(self, connection, artist_id, venue_id, start_time):
+        day = _as_date(start_time)
+        state = connection.execute(
+            select([self.Venue.state]).where(self.Venue.id == venue_id)
+        ).scalar() or ''
+
+        return [
+            (self.ShowMonthStateRollup.__table__, {'month': _month(day), 'state': state}),
+            (self.ArtistDayRollup.__table__, {'artist_id': artist_id, 'day': day}),
+            (self.VenueDayRollup.__table__, {'venue_id': venue_id, 'day': day}),
+        ]
+
+    def _count_show(self, connection, artist_id, venue_id, start_time, delta):
+        if start_time is None:
+            return
+        for table, key in self._rollup_keys(connection, artist_id, venue_id, start_time):
+            self._bump(connection, table, key, delta)
+
+    def _bump(self, connection, table, key, delta):
+        # one statement so concurrent writers never race on a missing row,
+        # supported by PostgreSQL 9.5+ and SQLite 3.24+
+        columns = ', '.join(key)
+        upsert = text('''
+        INSERT INTO "{table}" ({columns}, show_count)
+        VALUES ({values}, :delta)
+        ON CONFLICT ({columns}) DO UPDATE
+        SET show_count = "{table}".show_count + excluded.show_count
+        '''.format(table=table.name, columns=columns,
+                   values=', '.join(':' + column for column in key))
+        ).bindparams(*[bindparam(column, type_=table.c[column].type) for column in key])
+        connection.execute(upsert, delta=delta, **key)
+
+        if delta < 0:
+            match = and_(*[table.c[column] == value for column, value in key.items()])
+            connection.execute(table.delete().where(and_(match, table.c.show_count <= 0)))
+
+    def _after_show_insert(self, mapper, connection, show):
+        self._count_show(connection, show.artist_id, show.venue_id, show.start_time, 1)
+
+    def _after_show_delete(self, mapper, connection, show):
+        self._count_show(connection, show.artist_id, show.venue_id, show.start_time, -1)
+
+    def _before_show_update(self, mapper, connection, show):
+        # a show moved to another day, venue or artist leaves its old keys
+        # for the new ones. the old values are read from the row, like the
+        # venue state below
+        if not any(get_history(show, name).has_changes()
+                   for name in ('artist_id', 'venue_id', 'start_time')):
+            return
+        Show = self.Show
+        old = connection.execute(
+            select([Show.artist_id, Show.venue_id, Show.start_time]).where(Show.id == show.id)
+        ).first()
+        if old is None:
+            return
+        self._count_show(connection, old.artist_id, old.venue_id, old.start_time, -1)
+        self._count_show(connection, show.artist_id, show.venue_id, show.start_time, 1)
+
+    def _before_venue_update(self, mapper, connection, venue):
+        # the month/state rollup is keyed by the venue state, so the shows
+        # of a venue that moves go with it. the old state is read from the
+        # row, the attribute history does not have it once it was expired
+        if not get_history(venue, 'state').has_changes():
+            return
+        Venue = self.Venue
+        old_state = connection.execute(
+            select([Venue.state]).where(Venue.id == venue.id)
+        ).scalar() or ''
+        new_state = venue.state or ''
+        if old_state == new_state:
+            return
+
+        Show = self.Show
+        months = Counter(
+            _month(_as_date(start_time)) for start_time, in connection.execute(
+                select([Show.start_time]).where(and_(
+                    Show.venue_id == venue.id, Show.start_time.isnot(None)))))
+
+        table = self.ShowMonthStateRollup.__table__
+        for month, count in months.items():
+            self._bump(connection, table, {'month': month, 'state': old_state}, -count)
+            self._bump(connection, table, {'month': month, 'state': new_state}, count)
+
+    #  Rebuild
+    #  ----------------------------------------------------------------
+
+    def rebuild(self):
+        '''
+        rebuild()
+            recomputes every rollup from the Show table in a single
+            streaming pass and replaces the rollup contents in one transaction
+        '''
+        Show, Venue = self.Show, self.Venue
+        session = self.db.session
+
+        month_state = Counter()
+        artist_day = Counter()
+        venue_day = Counter()
+
+        total = 0
+        try:
+            rows = session.query(Show.artist_id, Show.venue_id, Show.start_time, Venue.state) \
+                .join(Venue, Show.venue_id == Venue.id) \
+                .filter(Show.start_time.isnot(None)) \
+                .yield_per(REBUILD_BATCH_SIZE)
+
+            for artist_id, venue_id, start_time, state in rows:
+                day = _as_date(start_time)
+                month_state[(_month(day), state or '')] += 1
+                artist_day[(artist_id, day)] += 1
+                venue_day[(venue_id, day)] += 1
+                total += 1
+
+            for model in (self.ShowMonthStateRollup, self.ArtistDayRollup, self.VenueDayRollup):
+                session.query(model).delete()
+
+            session.bulk_insert_mappings(self.ShowMonthStateRollup, [
+                {'month': month, 'state': state, 'show_count': count}
+                for (month, state), count in month_state.items()])
+            session.bulk_insert_mappings(self.ArtistDayRollup, [
+                {'artist_id': artist_id, 'day': day, 'show_count': count}
+                for (artist_id, day), count in artist_day.items()])
+            session.bulk_insert_mappings(self.VenueDayRollup, [
+                {'venue_id': venue_id, 'day': day, 'show_count': count}
+                for (venue_id, day), count in venue_day.items()])
+            session.commit()
+        except Exception:
+            current_app.logger.exception('analytics rebuild failed')
+            session.rollback()
+            raise
+
+        return total
+
+    #  Endpoints
+    #  ----------------------------------------------------------------
+
+    def _blueprint(self):
+        bp = Blueprint('analytics', __name__, url_prefix='/analytics')
+
+        @bp.route('/shows-per-month', methods=['GET'])
+        def shows_per_month():
+            Rollup = self.ShowMonthStateRollup
+            query = Rollup.query.order_by(Rollup.month, Rollup.state)
+
+            state = request.args.get('state')
+            if state:
+                query = query.filter(Rollup.state == state)
+
+            data = [{
+                'month': row.month,
+                'state': row.state,
+                'num_shows': row.show_count
+            } for row in query.all()]
+
+            return jsonify({'success': True, 'data': data})
+
+        @bp.route('/top-artists', methods=['GET'])
+        def top_artists():
+            limit = request.args.get('limit', 10, type=int)
+            if limit <= 0:
+                abort(400)
+
+            Rollup, Artist = self.ArtistDayRollup, self.Artist
+            upcoming = func.sum(Rollup.show_count).label('num_upcoming_shows')
+            result = self.db.session.query(Artist.id, Artist.name, upcoming) \
+                .join(Rollup, Rollup.artist_id == Artist.id) \
+                .filter(Rollup.day > datetime.date.today()) \
+                .group_by(Artist.id, Artist.name) \
+                .order_by(upcoming.desc(), Artist.id) \
+                .limit(limit) \
+                .all()
+
+            data = [{
+                'artist_id': artist_id,
+                'artist_name': name,
+                'num_upcoming_shows': int(count)
+            } for artist_id, name, count in result]
+
+            return jsonify({'success': True, 'data': data})
+
+        @bp.route('/venue-utilization', methods=['GET'])
+        def venue_utilization():
+            # share of days in the next <days> days with at least one show booked
+            days = request.args.get('days', 30, type=int)
+            if days <= 0:
+                abort(400)
+
+            today = datetime.date.today()
+            until = today + datetime.timedelta(days=days)
+
+            Rollup, Venue = self.VenueDayRollup, self.Venue
+            booked_days = func.count(Rollup.day).label('booked_days')
+            num_shows = func.coalesce(func.sum(Rollup.show_count), 0).label('num_shows')
+            result = self.db.session.query(Venue.id, Venue.name, booked_days, num_shows) \
+                .outerjoin(Rollup, and_(Rollup.venue_id == Venue.id,
+                                        Rollup.day > today,
+                                        Rollup.day <= until)) \
+                .group_by(Venue.id, Venue.name) \
+                .order_by(Venue.id) \
+                .all()
+
+            data = [{
+                'venue_id': venue_id,
+                'venue_name': name,
+                'booked_days': booked,
+                'num_upcoming_shows': int(shows),
+                'utilization': round(booked / days, 4)
+            } for venue_id, name, booked, shows in result]
+
+            return jsonify({'success': True, 'days': days, 'data': data})
+
+        @bp.route('/rebuild', methods=['POST'])
+        def rebuild():
+            try:
+                total = self.rebuild()
+            except Exception:
+                # logged and rolled back by rebuild()
+                abort(500)
+            return jsonify({'success': True, 'num_shows': total})
+
+        return bp
@@ -13,6 +13,7 @@ from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
+from analytics import Analytics
 import datetime
 import sys
 
@@ -83,6 +84,10 @@ class Show(db.Model):
     start_time = db.Column(db.Date)
 
 
+# rollup tables and /analytics endpoints for the dashboards
+analytics = Analytics(app, db, Venue, Artist, Show)
+
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
@@ -290,8 +295,14 @@ def delete_venue(venue_id):
   # Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   try:
-    Venue.query.filter_by(id=venue_id).delete()
-    db.session.commit()
+    # through the session rather than query.delete(), so the analytics
+    # rollups see the write. the shows go first, Show.venue_id is not nullable
+    venue = Venue.query.get(venue_id)
+    if venue is not None:
+      for show in venue.shows:
+        db.session.delete(show)
+      db.session.delete(venue)
+      db.session.commit()
   except:
     db.session.rollback()
   finally:
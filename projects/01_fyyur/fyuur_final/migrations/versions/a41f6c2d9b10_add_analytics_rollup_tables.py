@@ -0,0 +1,66 @@
+"""add analytics rollup tables
+
+Revision ID: a41f6c2d9b10
+Revises: 3b1b5c04cec2
+Create Date: 2026-10-18 10:02:11.514307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f6c2d9b10'
+down_revision = '3b1b5c04cec2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowMonthStateRollup',
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('show_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month', 'state')
+    )
+    op.create_table('ArtistDayRollup',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('show_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+    sa.PrimaryKeyConstraint('artist_id', 'day')
+    )
+    op.create_table('VenueDayRollup',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('show_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('venue_id', 'day')
+    )
+
+    # populate the rollups from the existing shows
+    op.execute("""
+        INSERT INTO "ShowMonthStateRollup" (month, state, show_count)
+        SELECT to_char(s.start_time, 'YYYY-MM'), coalesce(v.state, ''), count(*)
+        FROM "Show" s JOIN "Venue" v ON v.id = s.venue_id
+        WHERE s.start_time IS NOT NULL
+        GROUP BY 1, 2
+    """)
+    op.execute("""
+        INSERT INTO "ArtistDayRollup" (artist_id, day, show_count)
+        SELECT artist_id, start_time, count(*) FROM "Show"
+        WHERE start_time IS NOT NULL
+        GROUP BY 1, 2
+    """)
+    op.execute("""
+        INSERT INTO "VenueDayRollup" (venue_id, day, show_count)
+        SELECT venue_id, start_time, count(*) FROM "Show"
+        WHERE start_time IS NOT NULL
+        GROUP BY 1, 2
+    """)
+
+
+def downgrade():
+    op.drop_table('VenueDayRollup')
+    op.drop_table('ArtistDayRollup')
+    op.drop_table('ShowMonthStateRollup')
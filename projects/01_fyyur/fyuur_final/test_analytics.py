@@ -0,0 +1,107 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from app import app, db, Venue, Artist, Show, analytics, delete_venue
+
+# the tests run against a throw away sqlite file instead of the postgres
+# database of config.py
+fd, DATABASE_PATH = tempfile.mkstemp(suffix='.db', prefix='fyyur_test_')
+os.close(fd)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + DATABASE_PATH
+
+
+def tearDownModule():
+    with app.app_context():
+        db.engine.dispose()
+    os.remove(DATABASE_PATH)
+
+
+def day(offset):
+    return datetime.date.today() + datetime.timedelta(days=offset)
+
+
+class AnalyticsTestCase(unittest.TestCase):
+    """The incremental rollups must match what rebuild() computes"""
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        self.venues = [Venue(name='The Musical Hop', state='CA'),
+                       Venue(name='Park Square Live', state='NY')]
+        self.artists = [Artist(name='Guns N Petals'), Artist(name='Matt Quevedo')]
+        db.session.add_all(self.venues + self.artists)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def rollups(self):
+        db.session.expire_all()
+        return {model.__tablename__: sorted(
+            tuple(getattr(row, column.name) for column in model.__table__.columns)
+            for row in model.query)
+            for model in (analytics.ShowMonthStateRollup,
+                          analytics.ArtistDayRollup,
+                          analytics.VenueDayRollup)}
+
+    def assertRollupsRebuilt(self):
+        incremental = self.rollups()
+        analytics.rebuild()
+        self.assertEqual(incremental, self.rollups())
+        return incremental
+
+    def add_show(self, artist, venue, start_time):
+        show = Show(artist_id=artist.id, venue_id=venue.id, start_time=start_time)
+        db.session.add(show)
+        db.session.commit()
+        return show
+
+    def test_insert(self):
+        self.add_show(self.artists[0], self.venues[0], day(3))
+        self.add_show(self.artists[0], self.venues[0], day(3))
+        self.add_show(self.artists[1], self.venues[1], day(40))
+        rollups = self.assertRollupsRebuilt()
+        self.assertIn((self.venues[0].id, day(3), 2), rollups['VenueDayRollup'])
+
+    def test_update(self):
+        show = self.add_show(self.artists[0], self.venues[0], day(3))
+        self.add_show(self.artists[1], self.venues[0], day(3))
+
+        show.start_time = day(60)
+        db.session.commit()
+        self.assertRollupsRebuilt()
+
+        show.venue_id = self.venues[1].id
+        show.artist_id = self.artists[1].id
+        db.session.commit()
+        self.assertRollupsRebuilt()
+
+        self.venues[1].state = 'TX'
+        db.session.commit()
+        rollups = self.assertRollupsRebuilt()
+        self.assertEqual([state for _, state, _ in rollups['ShowMonthStateRollup']
+                          if state == 'NY'], [])
+
+    def test_delete(self):
+        show = self.add_show(self.artists[0], self.venues[0], day(3))
+        self.add_show(self.artists[1], self.venues[1], day(3))
+        db.session.delete(show)
+        db.session.commit()
+        self.assertRollupsRebuilt()
+
+        # the view deletes the venue and its shows through the session
+        venue_id = self.venues[1].id
+        delete_venue(venue_id)
+        self.assertIsNone(Venue.query.get(venue_id))
+        rollups = self.assertRollupsRebuilt()
+        self.assertEqual(rollups['VenueDayRollup'], [])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
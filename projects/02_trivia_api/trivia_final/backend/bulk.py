@@ -0,0 +1,178 @@
+import csv
+import hashlib
+import io
+import json
+import re
+
+from models import Question, Category, db
+from stats import add_counts, count_rows
+
+'''
+Bulk import / export of questions
+
+    read_records(stream, fmt)     yields question dicts from JSON Lines or CSV
+    import_questions(records)     inserts them in chunked transactions,
+                                  skipping questions whose normalized text
+                                  is already in the bank (or earlier in the file)
+                                  and rejecting the records of unknown categories
+    export_questions(fmt)         yields the whole bank as JSON Lines or CSV
+                                  lines, reading the table in batches
+
+Both directions stream, so memory does not grow with the file size
+(apart from one 8 byte digest per known question for deduplication).
+'''
+
+FORMATS = ('jsonl', 'csv')
+FIELDS = Question.FORMAT_FIELDS
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+# number of rejected records reported back in detail
+MAX_REPORTED_ERRORS = 20
+
+
+class BulkError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+def normalize_question(text):
+    # case, spacing and trailing punctuation do not make a new question
+    text = re.sub(r'\s+', ' ', text.strip().lower())
+    return text.rstrip(' ?!.')
+
+
+def question_digest(text):
+    return hashlib.blake2b(normalize_question(text).encode('utf-8'),
+                           digest_size=8).digest()
+
+
+def read_records(stream, fmt='jsonl'):
+    '''stream is a text stream (file, io.TextIOWrapper of a request body)'''
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+    elif fmt == 'csv':
+        reader = csv.DictReader(stream)
+        # line 1 is the header
+        for line_number, row in enumerate(reader, start=2):
+            yield line_number, row
+    else:
+        raise BulkError(f'unknown format {fmt}, expected one of {FORMATS}')
+
+
+def validate_record(record):
+    if not isinstance(record, dict):
+        raise ValueError('not an object')
+    question = record.get('question')
+    answer = record.get('answer')
+    if not isinstance(question, str) or not question.strip():
+        raise ValueError('question is required')
+    if not isinstance(answer, str) or not answer.strip():
+        raise ValueError('answer is required')
+    return {
+        'question': question.strip(),
+        'answer': answer.strip(),
+        'category': int(record['category']),
+        'difficulty': int(record['difficulty'])
+    }
+
+
+def known_digests():
+    digests = set()
+    for question, in db.session.query(Question.question) \
+            .yield_per(EXPORT_BATCH_SIZE):
+        if question:
+            digests.add(question_digest(question))
+    return digests
+
+
+def import_questions(records, chunk_size=IMPORT_CHUNK_SIZE):
+    '''
+    records are (line number, dict) pairs as yielded by read_records
+    returns a report of inserted / duplicate / rejected records
+    a failing chunk is rolled back and reported, earlier chunks stay committed
+    '''
+    report = {'inserted': 0, 'duplicates': 0, 'rejected': 0, 'errors': []}
+    seen = known_digests()
+    # checked per record, an unknown category would fail its whole chunk
+    # on the foreign key
+    categories = {category_id for category_id, in db.session.query(Category.id)}
+    table = Question.__table__
+    chunk = []
+
+    def reject(line_number, reason, count=1):
+        report['rejected'] += count
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_number, 'error': reason})
+
+    def flush(first_line):
+        if not chunk:
+            return
+        try:
+            db.session.execute(table.insert(), chunk)
+            add_counts(count_rows(chunk))
+            db.session.commit()
+            report['inserted'] += len(chunk)
+        except Exception as e:
+            db.session.rollback()
+            for row in chunk:
+                seen.discard(question_digest(row['question']))
+            reject(first_line, 'chunk of {} rows failed: {}'.format(
+                len(chunk), e.__class__.__name__), count=len(chunk))
+        chunk.clear()
+
+    first_line = None
+    for line_number, record in records:
+        try:
+            row = validate_record(record)
+        except (KeyError, TypeError, ValueError) as e:
+            reject(line_number, str(e) or e.__class__.__name__)
+            continue
+        if row['category'] not in categories:
+            reject(line_number, 'unknown category')
+            continue
+
+        digest = question_digest(row['question'])
+        if digest in seen:
+            report['duplicates'] += 1
+            continue
+        seen.add(digest)
+
+        if not chunk:
+            first_line = line_number
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush(first_line)
+    flush(first_line)
+
+    return report
+
+
+def export_questions(fmt='jsonl'):
+    if fmt not in FORMATS:
+        raise BulkError(f'unknown format {fmt}, expected one of {FORMATS}')
+
+    rows = db.session.query(*Question.projection()) \
+        .order_by(Question.id) \
+        .yield_per(EXPORT_BATCH_SIZE)
+
+    if fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(FIELDS, row))) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
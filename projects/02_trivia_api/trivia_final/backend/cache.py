@@ -0,0 +1,85 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+'''
+CachedValue
+    holds a single value produced by a loader function (usually a query)
+    the value is reloaded when it is older than ttl seconds
+    or after invalidate() has been called
+    hits / misses count how many loads were saved / performed
+'''
+
+
+class CachedValue:
+    def __init__(self, loader, ttl=60):
+        self.loader = loader
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._value = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is not None and now - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._value
+
+            self.misses += 1
+            self._value = self.loader()
+            self._loaded_at = now
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+'''
+invalidate_on(cache, model)
+    invalidates the cache whenever a row of the model is inserted,
+    updated or deleted through the ORM
+
+    the mapper events fire at flush, inside the transaction: the cache is
+    only marked in session.info there and invalidated once the session
+    commits, so a request reading in between cannot load (and keep) rows
+    that are not committed yet. a rollback drops the marks
+'''
+PENDING_KEY = 'invalidate_on_commit'
+
+
+def invalidate_on(cache, model):
+    def mark(mapper, connection, target):
+        session = object_session(target)
+        if session is None:
+            cache.invalidate()
+        else:
+            session.info.setdefault(PENDING_KEY, set()).add(cache)
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, mark)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_pending(session):
+    for cache in session.info.pop(PENDING_KEY, ()):
+        cache.invalidate()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    # a savepoint rollback keeps the marks of the enclosing transaction
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
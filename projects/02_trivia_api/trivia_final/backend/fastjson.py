@@ -0,0 +1,53 @@
+import json
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+JSON encoding for the list endpoints
+
+    make_encoder(name)
+        'orjson'  orjson (raises if it is not installed)
+        'stdlib'  the json module
+        'auto'    orjson when installed, otherwise the json module
+    every encoder turns an object into UTF-8 bytes
+
+    JsonResponder(name)(obj, status=200)
+        a flask Response built with the chosen encoder, used in place of
+        jsonify() where responses are large. pick the encoder with the
+        JSON_ENCODER app config key (default 'auto')
+'''
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    # categories are keyed by integer ids
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def make_encoder(name='auto'):
+    if name == 'auto':
+        name = 'stdlib' if orjson is None else 'orjson'
+    if name == 'orjson':
+        if orjson is None:
+            raise RuntimeError('orjson is not installed')
+        return _orjson_dumps
+    if name == 'stdlib':
+        return _stdlib_dumps
+    raise ValueError(f'unknown JSON encoder: {name}')
+
+
+class JsonResponder:
+    def __init__(self, name='auto'):
+        self.dumps = make_encoder(name)
+
+    def __call__(self, obj, status=200):
+        return Response(self.dumps(obj), status=status,
+                        mimetype='application/json')
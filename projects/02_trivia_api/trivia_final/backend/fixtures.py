@@ -0,0 +1,72 @@
+import os
+import re
+
+from sqlalchemy import text
+
+from models import db
+from stats import rebuild_stats
+
+'''
+Seed data for tests and local databases, read straight from the
+COPY blocks of a pg_dump file such as trivia.psql, so the fixtures
+never drift from the dump used to set up PostgreSQL.
+
+    seed_database(path)
+        bulk inserts every table of the dump that the models know,
+        in dump order, moves PostgreSQL id sequences past the
+        inserted ids and recomputes the question statistics.
+        works on any database SQLAlchemy supports.
+'''
+
+DEFAULT_DUMP = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'trivia.psql')
+
+COPY_RE = re.compile(r'^COPY (?:\w+\.)?(\w+) \(([^)]*)\) FROM stdin;$')
+COPY_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', '\\': '\\'}
+
+
+def _unescape(value):
+    if value == '\\N':
+        return None
+    return re.sub(r'\\(.)', lambda m: COPY_ESCAPES.get(m.group(1),
+                                                       m.group(1)), value)
+
+
+def read_copy_blocks(path=DEFAULT_DUMP):
+    '''yields (table, columns, rows) for each COPY ... FROM stdin block'''
+    with open(path, encoding='utf-8') as dump:
+        lines = iter(dump)
+        for line in lines:
+            match = COPY_RE.match(line.rstrip('\n'))
+            if not match:
+                continue
+            table = match.group(1)
+            columns = [column.strip() for column in match.group(2).split(',')]
+            rows = []
+            for row in lines:
+                row = row.rstrip('\n')
+                if row == '\\.':
+                    break
+                rows.append([_unescape(value) for value in row.split('\t')])
+            yield table, columns, rows
+
+
+def seed_database(path=DEFAULT_DUMP):
+    tables = db.metadata.tables
+    for name, columns, rows in read_copy_blocks(path):
+        if name not in tables or not rows:
+            continue
+        table = tables[name]
+        types = [table.c[column].type.python_type for column in columns]
+        db.session.execute(table.insert(), [
+            {column: None if value is None else cast(value)
+             for column, cast, value in zip(columns, types, row)}
+            for row in rows])
+
+        if db.engine.dialect.name == 'postgresql' and 'id' in table.c:
+            db.session.execute(text(
+                "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                "(SELECT max(id) FROM {}))".format(name)),
+                {'table': name})
+    rebuild_stats()
+    db.session.commit()
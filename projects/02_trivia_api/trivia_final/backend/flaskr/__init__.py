@@ -1,19 +1,122 @@
+import io
+import json
 import os
-from flask import Flask, request, abort, jsonify
+import click
+from collections import Counter
+from flask import Flask, Response, request, abort, jsonify, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS, cross_origin
-import random
+from sqlalchemy.exc import SQLAlchemyError
+import secrets
 import sys
 
-from models import setup_db, Question, Category, db
+from models import setup_db, database_path, Question, Category, db
+from cache import CachedValue, invalidate_on
+from quiz import QuizEngine, START_DIFFICULTY, RECENT_ANSWERS, \
+    target_difficulty, answer_matches, shuffled_index
+from kvstore import make_store
+from search import make_search
+from fastjson import JsonResponder
+from bulk import FORMATS, read_records, import_questions, export_questions
+from middleware import RateLimiter, ResponseCache, install
+from stats import add_counts, count_selection, rebuild_stats, read_stats
 
 QUESTIONS_PER_PAGE = 10
+# most rows a single batch delete / update may touch
+BATCH_ROW_CAP = 1000
+# seconds to keep the total question count before counting again
+QUESTION_COUNT_TTL = 60
+# seconds to keep the category map before reading it again
+CATEGORY_TTL = 300
+# seconds to keep the quiz question ids before reading them again, so
+# questions written by other workers are seen
+QUIZ_ENGINE_TTL = 60
+# seconds a quiz session is kept after its last request
+QUIZ_SESSION_TTL = 3600
+# requests per second and burst size allowed per client and endpoint
+RATE_LIMIT = 20
+RATE_LIMIT_BURST = 40
+# seconds to serve a cached response of the public list endpoints
+RESPONSE_CACHE_TTL = 5
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+
+    # list endpoints encode with orjson when available ('auto'),
+    # JSON_ENCODER = 'stdlib' forces the json module
+    json_response = JsonResponder(app.config.get('JSON_ENCODER', 'auto'))
+
+    # COUNT(*) is cached and invalidated whenever questions are added/removed
+    question_count = CachedValue(lambda: Question.query.count(),
+                                 ttl=QUESTION_COUNT_TTL)
+
+    # {id: type} of every category, reloaded when a category changes
+    def load_categories():
+        return {category.id: category.type
+                for category in Category.query.all()}
+
+    category_cache = CachedValue(load_categories, ttl=CATEGORY_TTL)
+    invalidate_on(category_cache, Category)
+
+    def category_map():
+        return category_cache.get()
+
+    # question ids per category and difficulty for picking quiz questions,
+    # invalidated by the writes of this process and expired after
+    # QUIZ_ENGINE_TTL seconds for the writes of the others
+    # ordered by id, so a reload keeps the positions the quiz sessions
+    # walk through
+    quiz_engine = QuizEngine(
+        lambda: db.session.query(Question.id, Question.category,
+                                 Question.difficulty)
+        .order_by(Question.id).all(),
+        ttl=app.config.get('QUIZ_ENGINE_TTL', QUIZ_ENGINE_TTL))
+    invalidate_on(quiz_engine, Question)
+
+    # seed and cursor of each quiz session and state of the
+    # adaptive quizzes,
+    # QUIZ_SESSION_STORE = 'memory' (default) or 'redis://localhost:6379/0'
+    quiz_sessions = make_store(app.config.get('QUIZ_SESSION_STORE', 'memory'))
+
+    # full-text search, PostgreSQL tsvector or an in-memory inverted index
+    question_search = make_search(app.config['SQLALCHEMY_DATABASE_URI'])
+    invalidate_on(question_search, Question)
+
+    # rate limits and cached GET responses, in the store of
+    # MIDDLEWARE_STORE = 'memory' (default) or 'redis://localhost:6379/0'
+    # RATE_LIMIT = 0 or RESPONSE_CACHE_TTL = 0 turn them off,
+    # TRUSTED_PROXIES = n rate limits on the address n reverse proxies
+    # forwarded in X-Forwarded-For instead of the peer address
+    middleware_store = make_store(app.config.get('MIDDLEWARE_STORE', 'memory'))
+    rate_limiter = RateLimiter(middleware_store,
+                               app.config.get('RATE_LIMIT', RATE_LIMIT),
+                               app.config.get('RATE_LIMIT_BURST',
+                                              RATE_LIMIT_BURST))
+    response_cache = ResponseCache(middleware_store,
+                                   app.config.get('RESPONSE_CACHE_TTL',
+                                                  RESPONSE_CACHE_TTL))
+    invalidate_on(response_cache, Question)
+    invalidate_on(response_cache, Category)
+    install(app, rate_limiter, response_cache)
+    app.extensions['trivia_rate_limiter'] = rate_limiter
+
+    # every in-process cache of the app, e.g. for tests to reset them
+    app.extensions['trivia_caches'] = [question_count, category_cache,
+                                       quiz_engine, question_search,
+                                       response_cache]
+
+    # set based writes bypass the ORM events, they call this instead
+    def invalidate_question_caches():
+        question_count.invalidate()
+        quiz_engine.invalidate()
+        question_search.invalidate()
+        response_cache.invalidate()
 
     '''
     Set up CORS. Allow '*' for origins.
@@ -40,14 +143,53 @@ def create_app(test_config=None):
     @app.route('/categories', methods=['GET'])
     @cross_origin()
     def get_categories():
-        categories = Category.query.all()
-        formatted_categories = {}
-        for category in categories:
-            formatted_categories[category.id] = category.type
-
-        return jsonify({'categories': formatted_categories,
+        return jsonify({'categories': category_map(),
                         'success': True})
 
+    '''
+    GET endpoint reporting how many database reads the caches saved,
+    not found unless CACHE_STATS_ENDPOINT is set: the counters tell
+    anyone how busy the server is
+    '''
+    @app.route('/cache/stats', methods=['GET'])
+    @cross_origin()
+    def get_cache_stats():
+        if not app.config.get('CACHE_STATS_ENDPOINT', False):
+            abort(404)
+        return jsonify({
+            'categories': category_cache.stats(),
+            'question_count': question_count.stats(),
+            'responses': response_cache.stats(),
+            'rate_limit': rate_limiter.stats(),
+            'success': True
+        })
+
+    '''
+    GET endpoint for the number of questions per category and difficulty,
+    read from the question_stats summary table (see stats.py) so the
+    cost does not depend on the number of questions
+    '''
+    @app.route('/stats', methods=['GET'])
+    @cross_origin()
+    def get_stats():
+        categories = {}
+        difficulties = {}
+        total = 0
+        for category, difficulty, count in read_stats():
+            by_category = categories.setdefault(
+                category, {'total': 0, 'difficulties': {}})
+            by_category['total'] += count
+            by_category['difficulties'][difficulty] = count
+            difficulties[difficulty] = difficulties.get(difficulty, 0) + count
+            total += count
+
+        return json_response({
+            'categories': categories,
+            'difficulties': difficulties,
+            'total_questions': total,
+            'success': True
+        })
+
     '''
     Create an endpoint to handle GET requests for questions,
     including pagination (every 10 questions).
@@ -59,22 +201,34 @@ def create_app(test_config=None):
     ten questions per page and pagination
     at the bottom of the screen for three pages.
     Clicking on the page numbers should update the questions.
+
+    Pagination is done by the database: either LIMIT/OFFSET with ?page=
+    or keyset pagination with ?after_id=<last id of the previous page>,
+    which stays fast however deep the page is.
     '''
     @app.route('/questions', methods=['GET'])
     @cross_origin()
     def get_questions():
         page = request.args.get('page', 1, type=int)
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
+        after_id = request.args.get('after_id', None, type=int)
+        if page < 1:
+            abort(400)
 
-        questions = Question.query.all()
-        formatted_questions = [question.format() for question in questions]
-        current_questions = formatted_questions[start:end]
-        categories = get_categories().get_json()['categories']
+        query = db.session.query(*Question.projection()).order_by(Question.id)
+        if after_id is not None:
+            query = query.filter(Question.id > after_id)
+        else:
+            query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+        rows = query.limit(QUESTIONS_PER_PAGE).all()
 
-        return jsonify({
+        current_questions = [Question.format_row(row) for row in rows]
+        last_id = rows[-1].id if rows else None
+        categories = category_map()
+
+        return json_response({
             'questions': current_questions,
-            'total_questions': len(formatted_questions),
+            'total_questions': question_count.get(),
+            'last_id': last_id,
             'categories': categories,
             'currentCategory': None,
             'success': True
@@ -94,6 +248,7 @@ def create_app(test_config=None):
         try:
             question = Question.query.get(question_id)
             question.delete()
+            question_count.invalidate()
             success = True
         except:
             db.session.rollback()
@@ -102,6 +257,114 @@ def create_app(test_config=None):
             db.session.close()
         return jsonify({'question_id': question_id, 'success': success})
 
+    '''
+    Batch delete / update of questions, selected either by
+        {"ids": [1, 2, 3]}
+    or by a filter expression
+        {"filter": {"category": 1, "difficulty": 5}}
+    Each batch runs as one set based statement, touches at most
+    BATCH_ROW_CAP rows, and reports the affected count plus the
+    requested ids that do not exist.
+    '''
+    def batch_selection(request_json):
+        if not isinstance(request_json, dict) or \
+                ('ids' in request_json) == ('filter' in request_json):
+            abort(400)
+
+        if 'ids' in request_json:
+            try:
+                ids = {int(question_id) for question_id in request_json['ids']}
+            except (TypeError, ValueError):
+                abort(400)
+            if not ids:
+                abort(400)
+            if len(ids) > BATCH_ROW_CAP:
+                abort(422)
+            query = Question.query.filter(Question.id.in_(ids))
+            found = {question_id for question_id, in
+                     query.with_entities(Question.id)}
+            return query, len(found), sorted(ids - found)
+
+        filters = request_json['filter']
+        if not isinstance(filters, dict) or not filters or \
+                not set(filters) <= {'category', 'difficulty'}:
+            abort(400)
+        query = Question.query
+        try:
+            for field, value in filters.items():
+                query = query.filter(
+                    getattr(Question, field) == int(value))
+        except (TypeError, ValueError):
+            abort(400)
+
+        count = query.count()
+        if count > BATCH_ROW_CAP:
+            abort(422)
+        return query, count, []
+
+    @app.route('/questions', methods=['DELETE'])
+    @cross_origin()
+    def batch_delete_questions():
+        query, count, not_found = batch_selection(request.get_json())
+        try:
+            counts = count_selection(query)
+            deleted = query.delete(synchronize_session=False)
+            add_counts({key: -count for key, count in counts.items()})
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(422)
+        finally:
+            db.session.close()
+        invalidate_question_caches()
+
+        return jsonify({
+            'deleted': deleted,
+            'not_found': not_found,
+            'success': True
+        })
+
+    @app.route('/questions', methods=['PATCH'])
+    @cross_origin()
+    def batch_update_questions():
+        request_json = request.get_json()
+        if not isinstance(request_json, dict):
+            abort(400)
+        values = request_json.pop('set', None)
+        if not isinstance(values, dict) or not values or \
+                not set(values) <= {'category', 'difficulty'}:
+            abort(400)
+        try:
+            values = {field: int(value) for field, value in values.items()}
+        except (TypeError, ValueError):
+            abort(400)
+
+        query, count, not_found = batch_selection(request_json)
+        try:
+            # move the counts of the selected questions to their new keys
+            moved = Counter()
+            for (category, difficulty), count in \
+                    count_selection(query).items():
+                moved[(category, difficulty)] -= count
+                moved[(values.get('category', category),
+                       values.get('difficulty', difficulty))] += count
+            updated = query.update(values, synchronize_session=False)
+            add_counts(moved)
+            db.session.commit()
+        except SQLAlchemyError:
+            # e.g. a category that does not exist
+            db.session.rollback()
+            abort(422)
+        finally:
+            db.session.close()
+        invalidate_question_caches()
+
+        return jsonify({
+            'updated': updated,
+            'not_found': not_found,
+            'success': True
+        })
+
     '''
     Create an endpoint to POST a new question,
     which will require the question and answer text,
@@ -120,8 +383,8 @@ def create_app(test_config=None):
             request_json = request.get_json()
             question = request_json['question']
             answer = request_json['answer']
-            category = request_json['category']
-            difficulty = request_json['difficulty']
+            category = int(request_json['category'])
+            difficulty = int(request_json['difficulty'])
 
             question = Question(question=question,
                                 answer=answer,
@@ -129,6 +392,7 @@ def create_app(test_config=None):
                                 difficulty=difficulty)
 
             question.insert()
+            question_count.invalidate()
         except:
             error = True
             db.session.rollback()
@@ -141,6 +405,41 @@ def create_app(test_config=None):
             # on successful db insert, flash success
             return jsonify({'success': True})
 
+    '''
+    Bulk import / export of questions as JSON Lines or CSV.
+    Both stream: the import reads the request body record by record and
+    inserts in chunked transactions, skipping duplicates (by normalized
+    question text); the export yields rows while reading them in batches.
+    The same is available from the command line with `flask trivia`.
+    '''
+    @app.route('/questions/import', methods=['POST'])
+    @cross_origin()
+    def import_questions_endpoint():
+        fmt = request.args.get('format', 'jsonl')
+        if fmt not in FORMATS:
+            abort(400)
+
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+        report = import_questions(read_records(stream, fmt))
+        if report['inserted']:
+            invalidate_question_caches()
+
+        report['success'] = True
+        return jsonify(report)
+
+    @app.route('/questions/export', methods=['GET'])
+    @cross_origin()
+    def export_questions_endpoint():
+        fmt = request.args.get('format', 'jsonl')
+        if fmt not in FORMATS:
+            abort(400)
+
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(export_questions(fmt)),
+                        mimetype=mimetype,
+                        headers={'Content-Disposition':
+                                 f'attachment; filename=questions.{fmt}'})
+
     '''
     Create a POST endpoint to get questions based on a search term.
     It should return any questions for whom the search term
@@ -149,23 +448,46 @@ def create_app(test_config=None):
     TEST: Search by any phrase. The questions list will update to include
     only question that include that string within their question.
     Try using the word "title" to start.
+
+    Every word of the term is matched as a word prefix in the question
+    and answer text, results are ranked by relevance and paginated,
+    and can be filtered by category and difficulty.
     '''
     @app.route('/questions', methods=['POST'])
     @cross_origin()
     def search_questions():
         request_json = request.get_json()
-        if request_json is not None and 'searchTerm' in request_json:
-            search_term = request_json['searchTerm']
-        else:
+        if request_json is None or 'searchTerm' not in request_json:
             abort(400)
-        questions = Question.query.filter(
-            Question.question.ilike(f"%{search_term}%")).all()
-        formatted_questions = [question.format() for question in questions]
-        categories = get_categories().get_json()['categories']
 
-        return jsonify({
+        try:
+            search_term = str(request_json['searchTerm'])
+            page = int(request_json.get('page', 1))
+            category = request_json.get('category')
+            category = None if category is None else int(category)
+            difficulty = request_json.get('difficulty')
+            difficulty = None if difficulty is None else int(difficulty)
+        except (TypeError, ValueError):
+            abort(400)
+        if page < 1:
+            abort(400)
+
+        total, ids = question_search.search(
+            search_term, category=category, difficulty=difficulty,
+            offset=(page - 1) * QUESTIONS_PER_PAGE, limit=QUESTIONS_PER_PAGE)
+
+        # keep the ranking order of the ids
+        rows = {row.id: row for row in
+                db.session.query(*Question.projection())
+                          .filter(Question.id.in_(ids))} if ids else {}
+        formatted_questions = [Question.format_row(rows[question_id])
+                               for question_id in ids
+                               if question_id in rows]
+        categories = category_map()
+
+        return json_response({
             'questions': formatted_questions,
-            'total_questions': len(formatted_questions),
+            'total_questions': total,
             'categories': categories,
             'success': True
         })
@@ -189,19 +511,39 @@ def create_app(test_config=None):
             # if category_id has not integer value
             abort(400)
 
-        request_json = request.get_json()
-        questions = Question.query.filter(
-            Question.category == category_id).all()
-        formatted_questions = [question.format() for question in questions]
-        categories = get_categories().get_json()['categories']
+        rows = db.session.query(*Question.projection()).filter(
+            Question.category == category_id).order_by(Question.id).all()
+        formatted_questions = [Question.format_row(row) for row in rows]
+        categories = category_map()
 
-        return jsonify({
+        return json_response({
             'questions': formatted_questions,
             'total_questions': len(formatted_questions),
             'categories': categories,
             'success': True
         })
 
+    '''
+    existing_question(pick, previous_ids) returns the Question of
+    pick(excluded ids), picking again without it when the id no longer
+    exists: the quiz engine is reloaded the first time, its ids lag
+    behind the questions deleted by another worker
+    '''
+    def existing_question(pick, previous_ids):
+        excluded = set(previous_ids)
+        reloaded = False
+        while True:
+            question_id = pick(excluded)
+            if question_id is None:
+                return None
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+            if not reloaded:
+                quiz_engine.invalidate()
+                reloaded = True
+            excluded.add(question_id)
+
     '''
     Create a POST endpoint to get questions to play the quiz.
     This endpoint should take category and previous question parameters
@@ -211,40 +553,255 @@ def create_app(test_config=None):
     TEST: In the "Play" tab, after a user selects "All" or a category,
     one question at a time is displayed, the user is allowed to answer
     and shown whether they were correct or not.
+
+    The question is drawn uniformly at random from the unseen questions
+    by the in-memory QuizEngine, then loaded by primary key.
     '''
     @app.route('/quizzes', methods=['POST'])
     @cross_origin()
     def quizzes():
         request_json = request.get_json()
-        previous_questions = set(request_json['previous_questions'])
-        quiz_category = request_json['quiz_category']
 
         try:
+            previous_questions = request_json['previous_questions']
+            quiz_category = request_json['quiz_category']
             # convert str to int to avoid the wrong string input
             quiz_category_id = int(quiz_category['id'])
         except:
             # wrong parameter
             abort(400)
 
-        if quiz_category_id == 0:
-            # All
-            questions = Question.query.all()
-        else:
-            questions = Question.query.filter(
-                Question.category == quiz_category_id).all()
-        formatted_questions = [question.format(
-        ) for question in questions if question.id not in previous_questions]
+        # ids only, a list of objects or null would fail in the engine
+        if not isinstance(previous_questions, list) or not all(
+                isinstance(question_id, int) and
+                not isinstance(question_id, bool)
+                for question_id in previous_questions):
+            abort(400)
+
+        # 0 means All
+        question = existing_question(
+            lambda excluded: quiz_engine.pick(quiz_category_id, excluded),
+            previous_questions)
+        next_question = None if question is None else question.format()
+
+        return jsonify({
+            'question': next_question,
+            'success': True
+        })
+
+    '''
+    Quiz sessions keep their question order on the server as a random
+    seed and a cursor over the ids of the category in the QuizEngine
+    (see quiz.shuffled_index), so the client only sends the session id
+    and each step is O(1) in time and storage whatever the length of
+    the quiz. Questions added after the session started are not played,
+    and a question deleted meanwhile shifts the positions that follow it:
+    one question of the category may be skipped or played twice.
+    '''
+    def quiz_session_key(session_id):
+        return 'quiz:' + session_id
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    @cross_origin()
+    def create_quiz_session():
+        request_json = request.get_json()
+
+        try:
+            quiz_category_id = int(request_json['quiz_category']['id'])
+        except:
+            abort(400)
+
+        # 0 means All
+        total = len(quiz_engine.question_ids(quiz_category_id))
+        state = {'category': quiz_category_id, 'total': total,
+                 'seed': secrets.randbits(63)}
 
-        if len(formatted_questions) > 0:
-            next_question = formatted_questions[0]
+        session_id = secrets.token_urlsafe(16)
+        quiz_sessions.set(quiz_session_key(session_id),
+                          json.dumps(state).encode('utf-8'), QUIZ_SESSION_TTL)
+
+        return jsonify({
+            'session_id': session_id,
+            'total_questions': total,
+            'success': True
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    @cross_origin()
+    def next_quiz_question(session_id):
+        key = quiz_session_key(session_id)
+        state = quiz_sessions.get(key)
+        if state is None:
+            # unknown or expired session
+            abort(404)
+        quiz_sessions.set(key, state, QUIZ_SESSION_TTL)
+        state = json.loads(state)
+        total = state['total']
+
+        next_question = None
+        while True:
+            # incr is atomic, concurrent requests get different positions
+            position = quiz_sessions.incr(key + ':cursor',
+                                          QUIZ_SESSION_TTL) - 1
+            if position >= total:
+                break
+
+            # skip positions past the end of a category that lost
+            # questions since the session started, and deleted questions
+            ids = quiz_engine.question_ids(state['category'])
+            index = shuffled_index(state['seed'], total, position)
+            if index >= len(ids):
+                continue
+            question = Question.query.get(ids[index])
+            if question is not None:
+                next_question = question.format()
+                break
+
+        return jsonify({
+            'question': next_question,
+            'remaining_questions': max(0, total - position - 1),
+            'success': True
+        })
+
+    '''
+    Adaptive quizzes pick each question near a target difficulty that
+    follows the player's recent answers (see quiz.target_difficulty).
+    The server keeps the quiz state and checks the answers, so the
+    questions are sent without their answer.
+    '''
+    def adaptive_key(session_id):
+        return 'adaptive:' + session_id
+
+    def load_adaptive(session_id):
+        state = quiz_sessions.get(adaptive_key(session_id))
+        if state is None:
+            # unknown or expired session
+            abort(404)
+        return json.loads(state)
+
+    def save_adaptive(session_id, state):
+        quiz_sessions.set(adaptive_key(session_id),
+                          json.dumps(state).encode('utf-8'), QUIZ_SESSION_TTL)
+
+    def next_adaptive_question(state):
+        question = existing_question(
+            lambda excluded: quiz_engine.pick_near(
+                state['category'], state['target'], excluded)[0],
+            state['seen'])
+        state['current'] = None if question is None else question.id
+        if question is None:
+            return None
+        state['seen'].append(question.id)
+        formatted = question.format()
+        del formatted['answer']
+        return formatted
+
+    @app.route('/quizzes/adaptive', methods=['POST'])
+    @cross_origin()
+    def create_adaptive_quiz():
+        request_json = request.get_json()
+
+        try:
+            quiz_category_id = int(request_json['quiz_category']['id'])
+        except:
+            abort(400)
+
+        session_id = secrets.token_urlsafe(16)
+        state = {'category': quiz_category_id, 'target': START_DIFFICULTY,
+                 'recent': [], 'seen': [], 'current': None,
+                 'answered': 0, 'correct': 0}
+        question = next_adaptive_question(state)
+        save_adaptive(session_id, state)
+
+        return jsonify({
+            'session_id': session_id,
+            'question': question,
+            'target_difficulty': state['target'],
+            'success': True
+        })
+
+    @app.route('/quizzes/adaptive/<session_id>/answer', methods=['POST'])
+    @cross_origin()
+    def answer_adaptive_quiz(session_id):
+        request_json = request.get_json()
+        if not isinstance(request_json, dict) or \
+                not isinstance(request_json.get('answer'), str):
+            abort(400)
+
+        state = load_adaptive(session_id)
+        if state['current'] is None:
+            # the quiz is over
+            abort(422)
+        question = Question.query.get(state['current'])
+        if question is None:
+            # deleted since it was asked, it does not count
+            correct, correct_answer = None, None
         else:
-            next_question = None
+            correct = answer_matches(request_json['answer'], question.answer)
+            correct_answer = question.answer
+            state['answered'] += 1
+            state['correct'] += correct
+            state['recent'] = (state['recent'] + [correct])[-RECENT_ANSWERS:]
+            state['target'] = target_difficulty(state['target'],
+                                                state['recent'])
+
+        next_question = next_adaptive_question(state)
+        save_adaptive(session_id, state)
 
         return jsonify({
+            'correct': correct,
+            'correct_answer': correct_answer,
+            'answered': state['answered'],
+            'correct_answers': state['correct'],
+            'target_difficulty': state['target'],
             'question': next_question,
             'success': True
         })
 
+    '''
+    flask trivia import questions.jsonl
+    flask trivia import questions.csv --format csv
+    flask trivia export > questions.jsonl
+    flask trivia rebuild-stats
+    '''
+    @app.cli.group('trivia')
+    def trivia_cli():
+        '''Trivia question bank commands.'''
+
+    @trivia_cli.command('import')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS),
+                  default=None, help='defaults to the file extension')
+    def import_command(source, fmt):
+        '''Import questions from a JSON Lines or CSV file ('-' for stdin).'''
+        if fmt is None:
+            fmt = 'csv' if source.name.endswith('.csv') else 'jsonl'
+        report = import_questions(read_records(source, fmt))
+        if report['inserted']:
+            invalidate_question_caches()
+
+        click.echo('inserted: {inserted}, duplicates: {duplicates}, '
+                   'rejected: {rejected}'.format(**report))
+        for error in report['errors']:
+            click.echo('line {line}: {error}'.format(**error), err=True)
+
+    @trivia_cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        '''Recompute the question counts of GET /stats from scratch.'''
+        rebuild_stats()
+        db.session.commit()
+        click.echo('question statistics rebuilt')
+
+    @trivia_cli.command('export')
+    @click.argument('target', type=click.File('w', encoding='utf-8'),
+                    default='-')
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS),
+                  default='jsonl')
+    def export_command(target, fmt):
+        '''Export every question as JSON Lines or CSV ('-' for stdout).'''
+        for chunk in export_questions(fmt):
+            target.write(chunk)
+
     '''
     Create error handlers for all expected errors
     including 404 and 422.
@@ -0,0 +1,202 @@
+import threading
+import time
+from array import array
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+'''
+Key-value stores for short lived server side state (quiz sessions,
+cached responses, rate limits, ...)
+
+    MemoryStore  in-process dict, the default
+    RedisStore   a local redis server, shared by every worker process
+
+make_store(url)
+    'memory' returns a MemoryStore
+    'redis://host:port/db' returns a RedisStore (requires the redis package)
+
+Both stores expire keys ttl seconds after they were last written.
+Lists hold integers only (question ids) and are consumed from the front.
+Values of get / set are bytes, counters of incr never expire unless
+incr is given a ttl.
+
+take_token(key, rate, burst) is a token bucket holding up to burst tokens
+and refilled with rate tokens per second. it takes one token and returns
+0, or returns the seconds until a token is available when it is empty.
+'''
+
+
+def make_store(url='memory'):
+    if url is None or url == 'memory':
+        return MemoryStore()
+    if url.startswith('redis://'):
+        return RedisStore(url)
+    raise ValueError(f'unknown key-value store: {url}')
+
+
+class MemoryStore:
+    def __init__(self):
+        # key -> (expires_at, value)
+        self._data = {}
+        self._lock = threading.Lock()
+        self._next_purge = 0
+
+    def _purge(self, now):
+        # drop expired keys at most once a second
+        if now < self._next_purge:
+            return
+        self._next_purge = now + 1
+        expired = [key for key, (expires_at, _) in self._data.items()
+                   if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+
+    def _live(self, key, now):
+        item = self._data.get(key)
+        if item is None or item[0] <= now:
+            return None
+        return item
+
+    def push_list(self, key, values, ttl):
+        # stored reversed in a compact int array so popping the front is O(1)
+        values = array('q', reversed(list(values)))
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            self._data[key] = (now + ttl, values)
+
+    def pop_list(self, key, ttl):
+        '''returns (first value or None, remaining count), None if key is missing'''
+        with self._lock:
+            now = time.monotonic()
+            item = self._live(key, now)
+            if item is None:
+                return None
+            values = item[1]
+            self._data[key] = (now + ttl, values)
+            if not values:
+                return None, 0
+            return values.pop(), len(values)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def get(self, key):
+        with self._lock:
+            item = self._live(key, time.monotonic())
+            return None if item is None else item[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            self._data[key] = (now + ttl, value)
+
+    def incr(self, key, ttl=None):
+        with self._lock:
+            now = time.monotonic()
+            item = self._live(key, now)
+            value = 1 if item is None else item[1] + 1
+            expires_at = float('inf') if ttl is None else now + ttl
+            self._data[key] = (expires_at, value)
+            return value
+
+    def take_token(self, key, rate, burst):
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            item = self._live(key, now)
+            if item is None:
+                tokens = burst
+            else:
+                tokens, updated_at = item[1]
+                tokens = min(burst, tokens + (now - updated_at) * rate)
+
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            # a bucket left alone until it is full again can be dropped
+            self._data[key] = (now + (burst - tokens) / rate, (tokens, now))
+            return wait
+
+
+# refill and take in one atomic step on the redis clock, the wait is
+# returned as a string since redis truncates lua numbers to integers
+TAKE_TOKEN_SCRIPT = '''
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1)
+return tostring(wait)
+'''
+
+
+class RedisStore:
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('the redis package is required for ' + url)
+        self.client = redis.Redis.from_url(url)
+        self._take_token = self.client.register_script(TAKE_TOKEN_SCRIPT)
+
+    # redis drops a list once it is empty, so a companion key
+    # records that the list (possibly empty) still exists
+
+    def push_list(self, key, values, ttl):
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        values = list(values)
+        if values:
+            pipe.rpush(key, *values)
+            pipe.expire(key, ttl)
+        pipe.set(key + ':live', 1, ex=ttl)
+        pipe.execute()
+
+    def pop_list(self, key, ttl):
+        pipe = self.client.pipeline()
+        pipe.lpop(key)
+        pipe.llen(key)
+        pipe.expire(key, ttl)
+        pipe.expire(key + ':live', ttl)
+        value, remaining, _, live = pipe.execute()
+        if not live:
+            return None
+        if value is None:
+            return None, 0
+        return int(value), remaining
+
+    def delete(self, key):
+        self.client.delete(key, key + ':live')
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def incr(self, key, ttl=None):
+        if ttl is None:
+            return self.client.incr(key)
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.pexpire(key, max(1, int(ttl * 1000)))
+        return pipe.execute()[0]
+
+    def take_token(self, key, rate, burst):
+        return float(self._take_token(keys=[key], args=[rate, burst]))
@@ -0,0 +1,393 @@
+'''
+Load test for the trivia API
+
+    python loadtest.py [--url http://127.0.0.1:5000] [--users 50]
+                       [--duration 60] [--output loadtest.json]
+    python loadtest.py --serve [--database-url sqlite:///trivia.db] ...
+        starts the app with `flask run` first, against the database of
+        --database-url or the default one of models.py, with rate
+        limiting and response caching off unless --middleware is given
+
+Every virtual user is an asyncio task with its own keep-alive connection
+that repeatedly plays one of the flows of the frontend, chosen by weight:
+
+    list      GET /questions, then the next two pages
+    category  GET /categories, then GET /categories/<id>/questions
+    search    POST /questions with a word of a known question
+    quiz      POST /quizzes five times, like one round of the Play tab
+
+The report has the request count, error count, throughput and latency
+percentiles of every endpoint and is written as JSON to --output.
+Only the standard library is needed, so it runs wherever the app runs.
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+QUIZ_LENGTH = 5
+FLOW_WEIGHTS = {'list': 3, 'category': 3, 'search': 2, 'quiz': 2}
+PERCENTILES = (50, 90, 95, 99)
+
+
+class HttpError(Exception):
+    pass
+
+
+class Connection:
+    '''
+    minimal HTTP/1.1 client on asyncio streams, reconnecting whenever the
+    server closes the connection (the werkzeug server speaks HTTP/1.0)
+    '''
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        '''returns (status, parsed JSON body or None)'''
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+
+        headers = [f'{method} {path} HTTP/1.1',
+                   f'Host: {self.host}:{self.port}',
+                   'Connection: keep-alive',
+                   'Accept: application/json']
+        payload = b''
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers += ['Content-Type: application/json',
+                        f'Content-Length: {len(payload)}']
+        self.writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('ascii')
+                          + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HttpError('connection closed by the server')
+        version, status = status_line.decode('latin-1').split()[:2]
+
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding') == 'chunked':
+            data = await self._read_chunked()
+        elif 'content-length' in response_headers:
+            data = await self.reader.readexactly(
+                int(response_headers['content-length']))
+        else:
+            data = await self.reader.read()
+            await self.close()
+
+        if version == 'HTTP/1.0' or \
+                response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+
+        try:
+            return int(status), json.loads(data) if data else None
+        except ValueError:
+            return int(status), None
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+
+class Recorder:
+    '''latency samples and errors per endpoint name'''
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.flows = dict.fromkeys(FLOW_WEIGHTS, 0)
+        self.recording = True
+
+    async def call(self, connection, name, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            status, data = await connection.request(method, path, body)
+        except (OSError, HttpError, asyncio.IncompleteReadError, ValueError):
+            await connection.close()
+            status, data = None, None
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if self.recording:
+            self.samples.setdefault(name, []).append(elapsed)
+            if status is None or status >= 400:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        if status is None or status >= 400:
+            return None
+        return data
+
+
+def percentile(ordered, p):
+    '''nearest-rank percentile of a sorted list'''
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    for name, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        latency = {'min': ordered[0],
+                   'mean': sum(ordered) / len(ordered),
+                   'max': ordered[-1]}
+        for p in PERCENTILES:
+            latency[f'p{p}'] = percentile(ordered, p)
+        endpoints[name] = {
+            'requests': len(ordered),
+            'errors': recorder.errors.get(name, 0),
+            'throughput_rps': len(ordered) / elapsed,
+            'latency_ms': {key: round(value, 3)
+                           for key, value in latency.items()}
+        }
+
+    total = sum(endpoint['requests'] for endpoint in endpoints.values())
+    return {
+        'duration_s': round(elapsed, 3),
+        'requests': total,
+        'errors': sum(recorder.errors.values()),
+        'throughput_rps': total / elapsed if elapsed else 0,
+        'flows': recorder.flows,
+        'endpoints': endpoints
+    }
+
+
+class Player:
+    '''one virtual user playing random flows until the deadline'''
+
+    def __init__(self, connection, recorder, catalog, rng, think):
+        self.connection = connection
+        self.recorder = recorder
+        self.catalog = catalog
+        self.rng = rng
+        self.think = think
+
+    async def call(self, name, method, path, body=None):
+        data = await self.recorder.call(self.connection, name, method, path,
+                                        body)
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+        return data
+
+    async def flow_list(self):
+        page = self.rng.randint(1, self.catalog['pages'])
+        for page in range(page, page + 3):
+            data = await self.call('GET /questions', 'GET',
+                                   f'/questions?page={page}')
+            if not data or not data['questions']:
+                break
+
+    async def flow_category(self):
+        await self.call('GET /categories', 'GET', '/categories')
+        category = self.rng.choice(self.catalog['categories'])
+        await self.call('GET /categories/<id>/questions', 'GET',
+                        f'/categories/{category}/questions')
+
+    async def flow_search(self):
+        term = self.rng.choice(self.catalog['words'])
+        await self.call('POST /questions (search)', 'POST', '/questions',
+                        {'searchTerm': term})
+
+    async def flow_quiz(self):
+        # 0 is All, as sent by the Play tab
+        category = self.rng.choice([0] + self.catalog['categories'])
+        previous = []
+        for _ in range(QUIZ_LENGTH):
+            data = await self.call('POST /quizzes', 'POST', '/quizzes', {
+                'previous_questions': previous,
+                'quiz_category': {'id': category, 'type': 'load test'}
+            })
+            if not data or not data['question']:
+                break
+            previous.append(data['question']['id'])
+
+    async def run(self, deadline):
+        flows = list(FLOW_WEIGHTS)
+        weights = list(FLOW_WEIGHTS.values())
+        while time.perf_counter() < deadline:
+            flow = self.rng.choices(flows, weights)[0]
+            await getattr(self, 'flow_' + flow)()
+            if self.recorder.recording:
+                self.recorder.flows[flow] += 1
+        await self.connection.close()
+
+
+async def discover(host, port):
+    '''categories, page count and search words from the running server'''
+    connection = Connection(host, port)
+    try:
+        _, categories = await connection.request('GET', '/categories')
+        _, questions = await connection.request('GET', '/questions?page=1')
+    finally:
+        await connection.close()
+
+    words = sorted({word.strip('?.,!"\'').lower()
+                    for question in questions['questions']
+                    for word in question['question'].split()
+                    if len(word) > 4} or {'what'})
+    return {
+        'categories': [int(category) for category in categories['categories']],
+        'pages': max(1, -(-questions['total_questions'] // 10)),
+        'words': words
+    }
+
+
+async def load_test(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    catalog = await discover(host, port)
+    recorder = Recorder()
+
+    players = [Player(Connection(host, port), recorder, catalog,
+                      random.Random(args.seed + i), args.think)
+               for i in range(args.users)]
+
+    start = time.perf_counter()
+    deadline = start + args.warmup + args.duration
+
+    async def start_player(player, delay):
+        await asyncio.sleep(delay)
+        await player.run(deadline)
+
+    tasks = [asyncio.ensure_future(
+                start_player(player, args.ramp * i / args.users))
+             for i, player in enumerate(players)]
+
+    # samples of the warm-up and ramp-up period are not reported
+    recorder.recording = False
+    await asyncio.sleep(args.warmup)
+    recorder.samples.clear()
+    recorder.errors.clear()
+    recorder.recording = True
+    measured_from = time.perf_counter()
+
+    await asyncio.gather(*tasks)
+    report = summarize(recorder, time.perf_counter() - measured_from)
+    report['config'] = {'url': args.url, 'users': args.users,
+                        'duration_s': args.duration, 'warmup_s': args.warmup,
+                        'ramp_s': args.ramp, 'think_s': args.think,
+                        'seed': args.seed}
+    return report
+
+
+def print_report(report):
+    header = ('endpoint', 'requests', 'errors', 'rps') + \
+        tuple(f'p{p} ms' for p in PERCENTILES)
+    rows = [(name, endpoint['requests'], endpoint['errors'],
+             '{:.1f}'.format(endpoint['throughput_rps']))
+            + tuple('{:.1f}'.format(endpoint['latency_ms'][f'p{p}'])
+                    for p in PERCENTILES)
+            for name, endpoint in report['endpoints'].items()]
+    widths = [max(len(str(x)) for x in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print('  '.join(str(x).rjust(w) for x, w in zip(row, widths)))
+    print('{requests} requests, {errors} errors, {rps:.1f} requests/s'.format(
+        requests=report['requests'], errors=report['errors'],
+        rps=report['throughput_rps']))
+
+
+def serve(url, database_url=None, middleware=False):
+    '''starts the app in a child process and waits until it answers'''
+    port = urlsplit(url).port or 5000
+    # every virtual user has the same address, the rate limiter would
+    # answer most of them 429 and the cache would hide the database
+    config = {} if middleware else {'RATE_LIMIT': 0, 'RESPONSE_CACHE_TTL': 0}
+    if database_url:
+        config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app = 'flaskr:create_app({!r})'.format(config)
+    env = dict(os.environ, FLASK_APP=app)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'flask', 'run', '--port', str(port),
+         '--no-reload', '--with-threads'],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    async def wait_ready():
+        for _ in range(100):
+            connection = Connection('127.0.0.1', port)
+            try:
+                await connection.request('GET', '/categories')
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+            finally:
+                await connection.close()
+        server.terminate()
+        raise SystemExit('the server did not start')
+
+    asyncio.run(wait_ready())
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=50,
+                        help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60,
+                        help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5,
+                        help='seconds of load before measuring starts')
+    parser.add_argument('--ramp', type=float, default=5,
+                        help='seconds over which the users start')
+    parser.add_argument('--think', type=float, default=0,
+                        help='mean pause in seconds after each request')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='loadtest.json')
+    parser.add_argument('--serve', action='store_true',
+                        help='start the app with flask run first')
+    parser.add_argument('--database-url',
+                        help='database of the app started by --serve')
+    parser.add_argument('--middleware', action='store_true',
+                        help='keep rate limiting and response caching on '
+                             'in the app started by --serve')
+    args = parser.parse_args()
+
+    server = serve(args.url, args.database_url, args.middleware) \
+        if args.serve else None
+    try:
+        report = asyncio.run(load_test(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print_report(report)
+    print(f'report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import math
+import re
+import threading
+
+from flask import Response, current_app, g, jsonify, request
+from flask_cors.core import get_cors_options, set_cors_headers
+
+'''
+Rate limiting and response caching in front of the public API
+
+    RateLimiter     a token bucket per client address and endpoint,
+                    clients over the limit get 429 with Retry-After
+    ResponseCache   keeps the body of successful GET responses of the
+                    list endpoints for a few seconds, keyed by the path
+                    and the sorted query arguments
+    install(app, limiter, response_cache)
+                    runs both around every request of the app
+
+    client_address(req, trusted_proxies)
+                    the address the rate limiter keys on
+
+Both keep their state in a kvstore store, so with a redis store every
+worker process shares the same buckets and cached responses.
+Behind reverse proxies set TRUSTED_PROXIES to their number, so the
+client address is the one of the player rather than the proxy.
+'''
+
+# GET endpoints whose responses may be cached
+CACHED_PATHS = re.compile(r'^/(categories|questions|categories/[^/]+/questions)$')
+
+
+class RateLimiter:
+    def __init__(self, store, rate, burst):
+        # rate requests per second on average, bursts of up to burst
+        # requests, rate = 0 turns the limiter off
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.allowed = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def check(self, client, endpoint):
+        '''returns 0 when the request may go on, else seconds to wait'''
+        if not self.rate:
+            return 0
+        wait = self.store.take_token(f'ratelimit:{client}:{endpoint}',
+                                     self.rate, self.burst)
+        with self._lock:
+            if wait:
+                self.throttled += 1
+            else:
+                self.allowed += 1
+        return wait
+
+    def stats(self):
+        return {
+            'allowed': self.allowed,
+            'throttled': self.throttled
+        }
+
+
+class ResponseCache:
+    '''
+    entries are stored under a generation number, invalidate() moves to
+    the next generation so every cached response is dropped at once
+    (old entries simply expire)
+    '''
+
+    def __init__(self, store, ttl, paths=CACHED_PATHS):
+        # ttl = 0 turns the cache off
+        self.store = store
+        self.ttl = ttl
+        self.paths = paths
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, req):
+        '''cache key of the request, None when it is not cacheable'''
+        if not self.ttl or req.method != 'GET' or \
+                not self.paths.match(req.path):
+            return None
+        # ?page=2&x= and ?x=&page=2 share one entry
+        args = sorted((name, value)
+                      for name, values in req.args.lists()
+                      for value in values if value != '')
+        generation = int(self.store.get('response:generation') or 0)
+        query = '&'.join(f'{name}={value}' for name, value in args)
+        return f'response:{generation}:{req.path}?{query}'
+
+    def get(self, key):
+        cached = self.store.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        mimetype, _, body = cached.partition(b'\n')
+        return Response(body, mimetype=mimetype.decode('ascii'))
+
+    def put(self, key, response):
+        if response.status_code != 200 or response.is_streamed:
+            return
+        self.store.set(key, response.mimetype.encode('ascii') + b'\n' +
+                       response.get_data(), self.ttl)
+
+    def invalidate(self):
+        self.store.incr('response:generation')
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def client_address(req, trusted_proxies=0):
+    '''
+    each of the trusted_proxies proxies in front of the app appends the
+    address it received the request from to X-Forwarded-For, the client
+    is the one the outermost proxy saw. the entries before it come from
+    the client and can be forged, with fewer entries than proxies the
+    header is not trusted at all
+    '''
+    if trusted_proxies:
+        forwarded = [address.strip() for address in
+                     req.headers.get('X-Forwarded-For', '').split(',')
+                     if address.strip()]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return req.remote_addr
+
+
+def install(app, limiter, response_cache):
+    @app.before_request
+    def limit_and_serve_cached():
+        client = client_address(request,
+                                current_app.config.get('TRUSTED_PROXIES', 0))
+        wait = limiter.check(client, request.endpoint)
+        if wait:
+            response = jsonify({
+                "success": False,
+                "error": 429,
+                "message": "too many requests"
+            })
+            response.status_code = 429
+            response.headers['Retry-After'] = str(math.ceil(wait))
+            return response
+
+        key = response_cache.key(request)
+        if key is None:
+            return None
+        response = response_cache.get(key)
+        if response is not None:
+            # the views of the cached paths are @cross_origin(), which does
+            # not run when the response comes from here: add its headers
+            set_cors_headers(response, get_cors_options(current_app))
+            response.headers['X-Cache'] = 'HIT'
+            return response
+        g.response_cache_key = key
+
+    @app.after_request
+    def cache_response(response):
+        key = g.pop('response_cache_key', None)
+        if key is not None:
+            response_cache.put(key, response)
+            response.headers['X-Cache'] = 'MISS'
+        return response
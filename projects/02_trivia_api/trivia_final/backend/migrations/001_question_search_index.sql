@@ -0,0 +1,15 @@
+--
+-- Full-text search index used by POST /questions (search.PostgresSearch)
+--
+-- psql trivia < migrations/001_question_search_index.sql
+--
+-- revert with:
+--   DROP INDEX IF EXISTS public.ix_questions_search;
+--
+
+CREATE INDEX IF NOT EXISTS ix_questions_search ON public.questions USING gin (
+    (setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+     setweight(to_tsvector('english', coalesce(answer, '')), 'B'))
+);
+
+ANALYZE public.questions;
@@ -0,0 +1,40 @@
+--
+-- Typed, indexed category foreign key on questions
+--
+-- psql trivia < migrations/002_question_category_fk.sql
+--
+-- questions.category becomes an integer foreign key to categories.id
+-- (databases created from the model had it as text) and gets an index
+-- on (category, id) for the category listing and the quiz queries.
+--
+-- revert with:
+--   DROP INDEX IF EXISTS public.ix_questions_category_id;
+--
+
+BEGIN;
+
+ALTER TABLE public.questions
+    ALTER COLUMN category TYPE integer USING nullif(category::text, '')::integer;
+
+UPDATE public.questions SET category = NULL
+    WHERE category NOT IN (SELECT id FROM public.categories);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'public.questions'::regclass AND contype = 'f'
+    ) THEN
+        ALTER TABLE ONLY public.questions
+            ADD CONSTRAINT category FOREIGN KEY (category)
+            REFERENCES public.categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category_id
+    ON public.questions (category, id);
+
+COMMIT;
+
+ANALYZE public.questions;
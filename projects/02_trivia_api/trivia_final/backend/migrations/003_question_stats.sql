@@ -0,0 +1,31 @@
+--
+-- Question counts per category and difficulty
+--
+-- psql trivia < migrations/003_question_stats.sql
+--
+-- question_stats holds the number of questions of every
+-- (category, difficulty) pair, 0 standing for a missing value.
+-- the app keeps it up to date, `flask trivia rebuild-stats`
+-- recomputes it. requires PostgreSQL 9.5+ (INSERT ... ON CONFLICT).
+--
+-- revert with:
+--   DROP TABLE IF EXISTS public.question_stats;
+--
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.question_stats (
+    category integer NOT NULL,
+    difficulty integer NOT NULL,
+    question_count integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (category, difficulty)
+);
+
+DELETE FROM public.question_stats;
+
+INSERT INTO public.question_stats (category, difficulty, question_count)
+    SELECT coalesce(category, 0), coalesce(difficulty, 0), count(*)
+    FROM public.questions
+    GROUP BY 1, 2;
+
+COMMIT;
@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, \
+    create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -35,9 +36,16 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id',
+                                          onupdate='CASCADE',
+                                          ondelete='SET NULL'))
     difficulty = Column(Integer)
 
+    # category listing and quiz queries filter by category, ordered by id
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+    )
+
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
@@ -64,6 +72,39 @@ class Question(db.Model):
             'difficulty': self.difficulty
         }
 
+    '''
+    projection() / format_row(row)
+        the columns of format(), for list queries that read plain rows
+        instead of hydrating Question objects:
+            rows = db.session.query(*Question.projection()).all()
+            [Question.format_row(row) for row in rows]
+    '''
+    FORMAT_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+    @classmethod
+    def projection(cls):
+        return tuple(getattr(cls, field) for field in cls.FORMAT_FIELDS)
+
+    @classmethod
+    def format_row(cls, row):
+        return dict(zip(cls.FORMAT_FIELDS, row))
+
+
+'''
+QuestionStat
+    number of questions per (category, difficulty), kept up to date
+    by stats.py so counts never need a scan of the questions table.
+    category / difficulty 0 stand for questions without one
+'''
+
+
+class QuestionStat(db.Model):
+    __tablename__ = 'question_stats'
+
+    category = Column(Integer, primary_key=True, autoincrement=False)
+    difficulty = Column(Integer, primary_key=True, autoincrement=False)
+    question_count = Column(Integer, nullable=False, default=0)
+
 
 '''
 Category
@@ -0,0 +1,196 @@
+import hashlib
+import random
+import re
+import threading
+import time
+
+'''
+QuizEngine
+    picks a uniformly random question the player has not seen yet
+
+    the ids of every question are kept in memory, grouped by category
+    (category 0 holds all of them) and by (category, difficulty), and
+    loaded with a single three column query the first time they are
+    needed, after invalidate() and when they are older than ttl seconds.
+    invalidate() only follows the writes of this process, the ttl bounds
+    how long the writes of other workers go unseen.
+
+    pick() draws random ids and rejects the ones already seen, which takes
+    n / (n - k) draws on average for k seen questions out of n. when most
+    of the category has been seen it switches to choosing from the list of
+    unseen ids so long quizzes never degrade into many retries.
+
+    pick_near() serves adaptive quizzes: it picks from the bucket of the
+    target difficulty, or of the closest difficulty with unseen questions,
+    so a selection looks at no more than the five difficulty buckets.
+    target_difficulty() moves the target after each answer.
+
+shuffled_index(seed, size, position)
+    the position-th index of a random permutation of range(size) chosen
+    by seed, so a quiz session keeps its question order as a seed and a
+    cursor instead of the whole shuffled list
+'''
+
+ALL_CATEGORIES = 0
+# switch from rejection sampling to the unseen list below this unseen ratio
+MIN_UNSEEN_RATIO = 0.25
+# Question.difficulty goes from 1 (easy) to 5 (hard)
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+# adaptive quizzes start in the middle and look at the last few answers
+START_DIFFICULTY = 3
+RECENT_ANSWERS = 3
+# rounds of the Feistel network of shuffled_index
+SHUFFLE_ROUNDS = 4
+
+
+class QuizEngine:
+    def __init__(self, loader, rng=None, ttl=None, clock=time.monotonic):
+        # loader returns (question_id, category, difficulty) for every question
+        # ttl = None keeps the ids until invalidate()
+        self.loader = loader
+        self.rng = rng or random.Random()
+        self.ttl = ttl
+        self.clock = clock
+        self._buckets = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._buckets = None
+            self._loaded_at = None
+
+    def _load(self):
+        ids = {ALL_CATEGORIES: []}
+        for question_id, category, difficulty in self.loader():
+            ids[ALL_CATEGORIES].append(question_id)
+            if category is not None:
+                ids.setdefault(category, []).append(question_id)
+            if difficulty is not None:
+                ids.setdefault((ALL_CATEGORIES, difficulty), []) \
+                    .append(question_id)
+                if category is not None:
+                    ids.setdefault((category, difficulty), []) \
+                        .append(question_id)
+
+        return {category: (tuple(id_list), frozenset(id_list))
+                for category, id_list in ids.items()}
+
+    def buckets(self):
+        with self._lock:
+            now = self.clock()
+            if self._buckets is None or (
+                    self.ttl is not None and now - self._loaded_at >= self.ttl):
+                self._buckets = self._load()
+                self._loaded_at = now
+            return self._buckets
+
+    def question_ids(self, category_id):
+        ids, _ = self.buckets().get(category_id, ((), frozenset()))
+        return ids
+
+    def pick(self, category_id, previous_ids=(), difficulty=None):
+        '''
+        returns a random question id of the category (0 for all)
+        and difficulty (None for any) which is not in previous_ids,
+        or None when none is left
+        '''
+        key = category_id if difficulty is None else (category_id, difficulty)
+        ids, id_set = self.buckets().get(key, ((), frozenset()))
+        if not ids:
+            return None
+
+        seen = id_set.intersection(previous_ids)
+        unseen = len(ids) - len(seen)
+        if unseen == 0:
+            return None
+
+        if unseen >= len(ids) * MIN_UNSEEN_RATIO:
+            while True:
+                question_id = ids[self.rng.randrange(len(ids))]
+                if question_id not in seen:
+                    return question_id
+
+        candidates = [question_id for question_id in ids
+                      if question_id not in seen]
+        return candidates[self.rng.randrange(len(candidates))]
+
+    def pick_near(self, category_id, difficulty, previous_ids=()):
+        '''
+        returns (question id, difficulty) of an unseen question as close
+        as possible to the difficulty, or (None, None) when none is left
+        '''
+        for distance in range(MAX_DIFFICULTY - MIN_DIFFICULTY + 1):
+            # harder or easier first at random when both are as close
+            candidates = [difficulty + distance, difficulty - distance]
+            if distance == 0:
+                candidates = candidates[:1]
+            else:
+                self.rng.shuffle(candidates)
+            for candidate in candidates:
+                if not MIN_DIFFICULTY <= candidate <= MAX_DIFFICULTY:
+                    continue
+                question_id = self.pick(category_id, previous_ids,
+                                        difficulty=candidate)
+                if question_id is not None:
+                    return question_id, candidate
+        return None, None
+
+
+def _shuffle_round(seed, round_number, value):
+    digest = hashlib.blake2b(b'%d:%d:%d' % (seed, round_number, value),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shuffled_index(seed, size, position):
+    '''
+    a Feistel network keyed by seed is a permutation of the integers of
+    an even number of bits, the smallest domain holding range(size) is at
+    most 4 times larger: values outside range(size) are permuted again
+    (cycle walking), 4 rounds of O(1) on average
+    '''
+    if not 0 <= position < size:
+        raise IndexError(position)
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    value = position
+    while True:
+        left, right = value >> half_bits, value & mask
+        for round_number in range(SHUFFLE_ROUNDS):
+            left, right = right, \
+                left ^ (_shuffle_round(seed, round_number, right) & mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+def target_difficulty(current, recent):
+    '''
+    the next target of an adaptive quiz: one step harder when most of the
+    last RECENT_ANSWERS answers (booleans, oldest first) were right,
+    one step easier when most were wrong
+    '''
+    recent = recent[-RECENT_ANSWERS:]
+    if not recent:
+        return current
+    ratio = sum(recent) / len(recent)
+    if ratio > 0.5:
+        current += 1
+    elif ratio < 0.5:
+        current -= 1
+    return max(MIN_DIFFICULTY, min(MAX_DIFFICULTY, current))
+
+
+def normalize_answer(text):
+    # case, punctuation, spacing and a leading article do not matter
+    words = re.findall(r'\w+', (text or '').lower())
+    if words and words[0] in ('the', 'a', 'an'):
+        words = words[1:]
+    return ' '.join(words)
+
+
+def answer_matches(given, expected):
+    given = normalize_answer(given)
+    return bool(given) and given == normalize_answer(expected)
@@ -0,0 +1,163 @@
+import bisect
+import re
+import threading
+
+from sqlalchemy import DDL, event, func
+
+from models import Question, db
+
+'''
+Full-text search over question and answer text
+
+    PostgresSearch   to_tsvector / to_tsquery served by the GIN index
+                     created in migrations/001_question_search_index.sql
+    MemorySearch     in-process inverted index, used with SQLite
+
+Both match every word of the search term as a prefix, weight matches in
+the question text above matches in the answer, and return the ids of one
+page of results ordered by relevance together with the total count.
+
+make_search(database_uri) picks the backend for the configured database.
+'''
+
+# same index as the migration, for databases created by db.create_all()
+SEARCH_INDEX_DDL = DDL("""
+CREATE INDEX IF NOT EXISTS ix_questions_search ON questions USING gin (
+    (setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+     setweight(to_tsvector('english', coalesce(answer, '')), 'B'))
+)
+""")
+event.listen(Question.__table__, 'after_create',
+             SEARCH_INDEX_DDL.execute_if(dialect='postgresql'))
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+QUESTION_WEIGHT = 1.0
+ANSWER_WEIGHT = 0.4
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def make_search(database_uri):
+    if database_uri.startswith(('postgres://', 'postgresql')):
+        return PostgresSearch()
+    return MemorySearch(
+        lambda: db.session.query(Question.id, Question.question,
+                                 Question.answer, Question.category,
+                                 Question.difficulty).all())
+
+
+class PostgresSearch:
+    # must stay identical to the indexed expression of the migration
+    document = func.setweight(
+        func.to_tsvector('english', func.coalesce(Question.question, '')),
+        'A').op('||')(func.setweight(
+            func.to_tsvector('english', func.coalesce(Question.answer, '')),
+            'B'))
+
+    def invalidate(self):
+        pass
+
+    def search(self, term, category=None, difficulty=None,
+               offset=0, limit=10):
+        words = tokenize(term)
+        if not words:
+            return 0, []
+
+        # every word as a prefix: 'tom hank' -> 'tom:* & hank:*'
+        query = func.to_tsquery('english',
+                                ' & '.join(word + ':*' for word in words))
+
+        questions = db.session.query(Question.id) \
+            .filter(self.document.op('@@')(query))
+        if category is not None:
+            questions = questions.filter(Question.category == category)
+        if difficulty is not None:
+            questions = questions.filter(Question.difficulty == difficulty)
+
+        total = questions.count()
+        rank = func.ts_rank(self.document, query)
+        ids = [question_id for question_id, in
+               questions.order_by(rank.desc(), Question.id)
+                        .offset(offset).limit(limit)]
+        return total, ids
+
+
+class MemorySearch:
+    '''
+    token -> {question id: weighted term frequency}, plus the sorted
+    vocabulary so a word can be matched as a prefix with bisect.
+    built from one query the first time it is needed and after invalidate()
+    '''
+
+    def __init__(self, loader):
+        # loader returns (id, question, answer, category, difficulty) rows
+        self.loader = loader
+        self._index = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _build(self):
+        postings = {}
+        attributes = {}
+        for question_id, question, answer, category, difficulty \
+                in self.loader():
+            attributes[question_id] = (category, difficulty)
+            for weight, text in ((QUESTION_WEIGHT, question),
+                                 (ANSWER_WEIGHT, answer)):
+                for token in tokenize(text):
+                    scores = postings.setdefault(token, {})
+                    scores[question_id] = scores.get(question_id, 0) + weight
+        return postings, sorted(postings), attributes
+
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._build()
+            return self._index
+
+    def _match_prefix(self, postings, vocabulary, word):
+        scores = {}
+        i = bisect.bisect_left(vocabulary, word)
+        while i < len(vocabulary) and vocabulary[i].startswith(word):
+            for question_id, score in postings[vocabulary[i]].items():
+                scores[question_id] = scores.get(question_id, 0) + score
+            i += 1
+        return scores
+
+    def search(self, term, category=None, difficulty=None,
+               offset=0, limit=10):
+        words = tokenize(term)
+        if not words:
+            return 0, []
+
+        postings, vocabulary, attributes = self.index()
+
+        ranked = None
+        for word in words:
+            scores = self._match_prefix(postings, vocabulary, word)
+            if ranked is None:
+                ranked = scores
+            else:
+                ranked = {question_id: ranked[question_id] + score
+                          for question_id, score in scores.items()
+                          if question_id in ranked}
+            if not ranked:
+                return 0, []
+
+        if category is not None or difficulty is not None:
+            ranked = {
+                question_id: score for question_id, score in ranked.items()
+                if (category is None
+                    or attributes[question_id][0] == category)
+                and (difficulty is None
+                     or attributes[question_id][1] == difficulty)}
+
+        # highest score first, ties by id
+        ordered = sorted(ranked.items(), key=lambda item: (-item[1], item[0]))
+        return len(ordered), [question_id for question_id, _ in
+                              ordered[offset:offset + limit]]
@@ -0,0 +1,115 @@
+from collections import Counter
+
+from sqlalchemy import event, func, inspect, select, text
+
+from models import Question, QuestionStat, Category, db
+
+'''
+Question counts per (category, difficulty) in the question_stats table
+
+Every question written through the ORM adjusts its row of the table in
+the same transaction (mapper events below). Set based writes, which
+bypass the ORM, pass their changes to add_counts() themselves:
+
+    add_counts(counts)         adds a Counter of (category, difficulty)
+    count_rows(rows)           Counter of question dicts / rows
+    count_selection(query)     Counter of the questions a query selects
+    rebuild_stats()            recomputes the table with one GROUP BY,
+                               also run by `flask trivia rebuild-stats`
+    read_stats()               the non empty (category, difficulty,
+                               count) rows, at most categories x 5
+'''
+
+# one statement so concurrent writers never race on a missing row,
+# supported by PostgreSQL 9.5+ and SQLite 3.24+
+UPSERT = text("""
+INSERT INTO question_stats (category, difficulty, question_count)
+VALUES (:category, :difficulty, :delta)
+ON CONFLICT (category, difficulty) DO UPDATE
+SET question_count = question_stats.question_count + excluded.question_count
+""")
+
+
+def stat_key(category, difficulty):
+    return category or 0, difficulty or 0
+
+
+def add_counts(counts, connection=None):
+    params = [{'category': category, 'difficulty': difficulty, 'delta': delta}
+              for (category, difficulty), delta in counts.items() if delta]
+    if params:
+        (connection or db.session).execute(UPSERT, params)
+
+
+def count_rows(rows):
+    return Counter(stat_key(row['category'], row['difficulty'])
+                   for row in rows)
+
+
+def count_selection(query):
+    grouped = query.with_entities(Question.category, Question.difficulty,
+                                  func.count(Question.id)) \
+        .group_by(Question.category, Question.difficulty) \
+        .order_by(None)
+    counts = Counter()
+    for category, difficulty, count in grouped:
+        counts[stat_key(category, difficulty)] += count
+    return counts
+
+
+def rebuild_stats(connection=None):
+    connection = connection or db.session
+    grouped = select([Question.category, Question.difficulty,
+                      func.count(Question.id)]) \
+        .group_by(Question.category, Question.difficulty)
+    counts = Counter()
+    for category, difficulty, count in connection.execute(grouped):
+        counts[stat_key(category, difficulty)] += count
+    connection.execute(QuestionStat.__table__.delete())
+    add_counts(counts, connection)
+
+
+def read_stats():
+    return db.session.query(QuestionStat.category, QuestionStat.difficulty,
+                            QuestionStat.question_count) \
+        .filter(QuestionStat.question_count > 0) \
+        .order_by(QuestionStat.category, QuestionStat.difficulty) \
+        .all()
+
+
+@event.listens_for(Question, 'after_insert')
+def _count_insert(mapper, connection, target):
+    add_counts({stat_key(target.category, target.difficulty): 1}, connection)
+
+
+@event.listens_for(Question, 'after_delete')
+def _count_delete(mapper, connection, target):
+    add_counts({stat_key(target.category, target.difficulty): -1}, connection)
+
+
+@event.listens_for(Question, 'after_update')
+def _count_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    category = attrs.category.history
+    difficulty = attrs.difficulty.history
+    if not category.has_changes() and not difficulty.has_changes():
+        return
+    old = stat_key(
+        category.deleted[0] if category.deleted else target.category,
+        difficulty.deleted[0] if difficulty.deleted else target.difficulty)
+    new = stat_key(target.category, target.difficulty)
+    if old != new:
+        add_counts(Counter({old: -1, new: 1}), connection)
+
+
+# deleting or renumbering a category moves its questions in the database
+# (ON DELETE SET NULL / ON UPDATE CASCADE), which only a rebuild can see
+@event.listens_for(Category, 'after_delete')
+def _category_deleted(mapper, connection, target):
+    rebuild_stats(connection)
+
+
+@event.listens_for(Category, 'after_update')
+def _category_updated(mapper, connection, target):
+    if inspect(target).attrs.id.history.has_changes():
+        rebuild_stats(connection)
@@ -0,0 +1,38 @@
+--
+-- Drink.recipe as a JSON column
+--
+-- sqlite3 src/database/database.db < migrations/001_recipe_json.sql
+--
+-- the recipe used to be a VARCHAR(180) holding JSON text, it becomes a
+-- JSON column without length limit that SQLAlchemy decodes once when a
+-- row is loaded. recipes stored as a single ingredient object are
+-- wrapped in a list, the form the frontend expects. SQLite cannot
+-- change the type of a column so the table is rebuilt (requires the
+-- JSON1 functions, built into SQLite 3.38+).
+--
+-- on PostgreSQL:
+--   ALTER TABLE drink ALTER COLUMN recipe TYPE json USING
+--     CASE WHEN json_typeof(recipe::json) = 'array' THEN recipe::json
+--          ELSE json_build_array(recipe::json) END;
+--
+
+BEGIN;
+
+CREATE TABLE drink_new (
+    id INTEGER NOT NULL,
+    title VARCHAR(80),
+    recipe JSON NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE (title)
+);
+
+INSERT INTO drink_new (id, title, recipe)
+SELECT id, title,
+       CASE WHEN json_type(recipe) = 'array' THEN json(recipe)
+            ELSE json_array(json(recipe)) END
+FROM drink;
+
+DROP TABLE drink;
+ALTER TABLE drink_new RENAME TO drink;
+
+COMMIT;
@@ -0,0 +1,46 @@
+--
+-- Ingredient index of the drinks
+--
+-- sqlite3 src/database/database.db < migrations/002_drink_ingredient_index.sql
+--
+-- drink_ingredient holds one row per drink and lower cased ingredient
+-- name, GET /drinks/search finds drinks by ingredient from it instead
+-- of decoding every recipe. the app keeps it up to date on drink
+-- writes, this fills it from the recipes already stored. requires
+-- migrations/001_recipe_json.sql (recipes are lists of ingredients).
+--
+-- on PostgreSQL the backfill reads:
+--   INSERT INTO drink_ingredient (drink_id, name)
+--   SELECT DISTINCT drink.id, lower(trim(ingredient->>'name'))
+--   FROM drink, json_array_elements(drink.recipe) AS ingredient
+--   WHERE trim(coalesce(ingredient->>'name', '')) <> '';
+--
+-- ingredient names are not limited in the recipes, so neither is
+-- drink_ingredient.name. a PostgreSQL table created with VARCHAR(80)
+-- is widened with:
+--   ALTER TABLE drink_ingredient ALTER COLUMN name TYPE VARCHAR;
+--
+-- revert with:
+--   DROP TABLE IF EXISTS drink_ingredient;
+--
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS drink_ingredient (
+    drink_id INTEGER NOT NULL,
+    name VARCHAR NOT NULL,
+    PRIMARY KEY (drink_id, name),
+    FOREIGN KEY (drink_id) REFERENCES drink (id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_drink_ingredient_name
+    ON drink_ingredient (name);
+
+DELETE FROM drink_ingredient;
+
+INSERT INTO drink_ingredient (drink_id, name)
+SELECT DISTINCT drink.id, lower(trim(json_extract(ingredient.value, '$.name')))
+FROM drink, json_each(drink.recipe) AS ingredient
+WHERE trim(coalesce(json_extract(ingredient.value, '$.name'), '')) <> '';
+
+COMMIT;
@@ -0,0 +1,28 @@
+--
+-- Version of the drinks menu
+--
+-- sqlite3 src/database/database.db < migrations/003_menu_version.sql
+--
+-- menu_version holds a single row whose version the app bumps in the
+-- transaction of every drink write. each worker reads it before
+-- serving its cached menu and rebuilds the menu when it changed, so a
+-- write handled by one worker reaches the menus of all of them.
+-- (the same statements run unchanged on PostgreSQL)
+--
+-- revert with:
+--   DROP TABLE IF EXISTS menu_version;
+--
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS menu_version (
+    id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (id)
+);
+
+INSERT INTO menu_version (id, version)
+SELECT 1, 0
+WHERE NOT EXISTS (SELECT 1 FROM menu_version WHERE id = 1);
+
+COMMIT;
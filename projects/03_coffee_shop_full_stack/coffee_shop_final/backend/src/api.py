@@ -1,10 +1,17 @@
 import os
-from flask import Flask, request, jsonify, abort
+import hashlib
+import click
+from flask import Flask, Response, request, jsonify, abort
 from sqlalchemy import exc
 import json
 from flask_cors import CORS, cross_origin
 from .database.models import db_drop_and_create_all, setup_db, Drink, db
-from .auth.auth import AuthError, requires_auth
+from .database.ingredients import rebuild_index, search_drinks
+from .auth.auth import AuthError, requires_auth, \
+    check_permissions, requirement
+from .bulk import Batch, BulkError, PERMISSIONS as BULK_PERMISSIONS
+from .menu import MenuCache, PageError, DEFAULT_PAGE_SIZE, decode_cursor, \
+    drinks_page, encode_cursor, menu_version, parse_fields, parse_limit
 import sys
 
 app = Flask(__name__)
@@ -37,6 +44,58 @@ def after_request(response):
 '''
 # db_drop_and_create_all()
 
+'''
+the serialized menus of GET /drinks and GET /drinks-detail, rebuilt by
+the endpoints that write drinks and whenever the menu_version row shows
+that another worker wrote drinks (see menu.py)
+'''
+menu = MenuCache(lambda: Drink.query.all(),
+                 lambda: menu_version(db.session))
+
+
+'''
+menu_response(form, cache_control)
+    the cached menu of that form, with its ETag, or 304 Not Modified
+    when the client sent that ETag in If-None-Match
+
+    with ?limit=, ?cursor= or ?fields= one page of the menu is read from
+    the database instead, selecting only the columns of the fields
+        fields  comma separated among id, title, recipe (id is always sent)
+        limit   drinks per page, up to 500 (50 once a cursor is given)
+        cursor  the next_cursor of the previous page
+    and the body gets "next_cursor", null on the last page
+'''
+def menu_response(form, cache_control):
+    args = request.args
+    if any(name in args for name in ('cursor', 'limit', 'fields')):
+        try:
+            fields = parse_fields(args.get('fields'))
+            limit = parse_limit(args.get('limit'))
+            after = decode_cursor(args['cursor']) if 'cursor' in args \
+                else None
+        except PageError:
+            abort(400)
+        if after is not None and limit is None:
+            limit = DEFAULT_PAGE_SIZE
+
+        drinks, last_id = drinks_page(db.session, form, fields, after, limit)
+        body = json.dumps({
+            'success': True,
+            'drinks': drinks,
+            'next_cursor': encode_cursor(last_id)
+            if last_id is not None else None
+        }, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+    else:
+        body, etag = menu.get(form)
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # clients may keep the menu but have to revalidate it every time
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+
 # ROUTES
 '''
     GET /drinks
@@ -50,10 +109,27 @@ def after_request(response):
 @app.route('/drinks', methods=['GET'])
 @cross_origin()
 def get_drinks():
-    drinks = Drink.query.all()
-    short_drinks = [drink.short() for drink in drinks]
+    return menu_response('short', 'no-cache')
 
-    return jsonify({"success": True, "drinks": short_drinks})
+
+'''
+    GET /drinks/search?ingredient=<name>&title=<text>
+        it should be a public endpoint
+        ingredient may be repeated, drinks must have all of them (names
+        are case insensitive), title matches part of the title
+        it should contain only the drink.short() data representation
+    returns status code 200 and json {"success": True, "drinks": drinks}
+        with the matching drinks, every drink when no filter is given
+'''
+
+
+@app.route('/drinks/search', methods=['GET'])
+@cross_origin()
+def search_drinks_by_ingredient():
+    drinks = search_drinks(request.args.getlist('ingredient'),
+                           request.args.get('title'))
+    return jsonify({"success": True,
+                    "drinks": [drink.short() for drink in drinks]})
 
 
 '''
@@ -69,10 +145,7 @@ def get_drinks():
 @requires_auth('get:drinks-detail')
 @cross_origin()
 def get_drinks_detail(payload):
-    drinks = Drink.query.all()
-    long_drinks = [drink.long() for drink in drinks]
-
-    return jsonify({"success": True, "drinks": long_drinks})
+    return menu_response('long', 'private, no-cache')
 
 
 '''
@@ -93,7 +166,7 @@ def post_drinks(payload):
         # get new values
         request_json = request.get_json()
         title = request_json['title']
-        recipe = json.dumps(request_json['recipe'])
+        recipe = request_json['recipe']
 
         # create a new row in the drinks table
         drink = Drink(title=title, recipe=recipe)
@@ -109,6 +182,7 @@ def post_drinks(payload):
         abort(400)
     else:
         # on successful db insert
+        menu.rebuild()
         return jsonify({"success": True, "drinks": long_drink})
 
     
@@ -142,7 +216,7 @@ def patch_drinks(payload, id):
         
         if 'recipe' in request_json:
             # update field values
-            recipe = json.dumps(request_json['recipe'])
+            recipe = request_json['recipe']
             drink.recipe = recipe
 
         drink.update()
@@ -156,6 +230,7 @@ def patch_drinks(payload, id):
     finally:
         db.session.close()
 
+    menu.rebuild()
     return jsonify({"success": success, "drinks": [long_drink]})
 
 '''
@@ -183,8 +258,61 @@ def delete_drinks(payload, id):
     finally:
         db.session.close()
 
+    menu.rebuild()
     return jsonify({"success": success, "delete": id})
 
+'''
+    POST /drinks/bulk
+        creates, updates and deletes drinks in a single transaction
+        {"create": [{"title", "recipe"}], "update": [{"id", "title"?, "recipe"?}],
+         "delete": [id]}
+        it should require the permissions of the operations in the batch
+        (post:drinks, patch:drinks, delete:drinks)
+    returns status code 200 and json {"success": True, "create": [...],
+        "update": [...], "delete": [...]} with the result of every item in
+        the order of the request, or 422 with the failed items when any of
+        them fails, in which case nothing is applied
+'''
+@app.route('/drinks/bulk', methods=['POST'])
+@requires_auth(any_of=tuple(BULK_PERMISSIONS.values()))
+@cross_origin()
+def bulk_drinks(payload):
+    try:
+        batch = Batch.parse(request.get_json(silent=True))
+    except BulkError:
+        abort(400)
+
+    # one check for all the operations of the batch
+    try:
+        check_permissions(requirement(batch.permissions()), payload)
+    except AuthError as ae:
+        return jsonify(ae.error), ae.status_code
+
+    try:
+        success, results = batch.apply()
+    finally:
+        db.session.close()
+    if not success:
+        return jsonify(dict(results, success=False, error=422,
+                            message='unprocessable, nothing applied')), 422
+
+    menu.rebuild()
+    return jsonify(dict(results, success=True))
+
+
+'''
+    flask rebuild-ingredients
+        fills the ingredient index of GET /drinks/search again from every
+        recipe, e.g. after recipes were written outside of the app
+'''
+@app.cli.command('rebuild-ingredients')
+def rebuild_ingredients_command():
+    '''Rebuild the ingredient index of the drinks from their recipes.'''
+    rows = rebuild_index()
+    db.session.commit()
+    click.echo(f'ingredient index rebuilt: {rows} rows')
+
+
 # Error Handling
 '''
 Example error handling for unprocessable entity
@@ -1,183 +1,62 @@
-import json
-from flask import request, _request_ctx_stack
-from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+import os
+
+from auth0_flask import Auth, AuthError, JWKSCache
 
 
 AUTH0_DOMAIN = 'dev-76d8bb3e.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee-shop'
+JWKS_URL = os.environ.get('AUTH0_JWKS_URL',
+                          f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
 
-## AuthError Exception
-'''
-AuthError Exception
-A standardized way to communicate auth failure modes
-'''
-class AuthError(Exception):
-    def __init__(self, error, status_code):
-        self.error = error
-        self.status_code = status_code
-
-
-## Auth Header
+# the permissions of the coffee shop API in Auth0
+PERMISSIONS = (
+    'get:drinks-detail',
+    'post:drinks',
+    'patch:drinks',
+    'delete:drinks',
+)
 
 '''
-    implement get_token_auth_header() method
-    it should attempt to get the header from the request
-        it should raise an AuthError if no header is present
-    it should attempt to split bearer and the token
-        it should raise an AuthError if the header is malformed
-    return the token part of the header
+payloads of the tokens verified lately, clients send the same token
+until it expires so most requests skip the signature check,
+TOKEN_CACHE_SIZE = 0 turns the cache off
 '''
-def get_token_auth_header():
-    '''
-    Obtains the Access Token from the Authorization Header
-    '''
-    auth = request.headers.get('Authorization', None)
-    if not auth:
-        raise AuthError({
-            'success': False,
-            'error': 401,
-            'message': 'authorization_header_missing. Authorization header is expected.'
-        }, 401)
-
-    parts = auth.split()
-    if parts[0].lower() != 'bearer':
-        raise AuthError({
-            'success': False,
-            'error': 401,
-            'message': 'invalid_header. Authorization header must start with "Bearer".'
-        }, 401)
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
 
-    elif len(parts) == 1:
-        raise AuthError({
-            'success': False,
-            'error': 401,
-            'message': 'invalid_header. Token not found.'
-        }, 401)
+# the background refresh of the signing keys starts with the first
+# authenticated request, AUTH0_JWKS_BACKGROUND_REFRESH=0 turns it off
+JWKS_BACKGROUND_REFRESH = \
+    os.environ.get('AUTH0_JWKS_BACKGROUND_REFRESH', '1') != '0'
 
-    elif len(parts) > 2:
-        raise AuthError({
-            'success': False,
-            'error': 401,
-            'message': 'invalid_header. Authorization header must be bearer token.'
-        }, 401)
 
-    token = parts[1]
-    return token
-
-'''
-@TODO implement check_permissions(permission, payload) method
-    @INPUTS
-        permission: string permission (i.e. 'post:drink')
-        payload: decoded jwt payload
+def error_body(code, description, status_code):
+    return {
+        'success': False,
+        'error': status_code,
+        'message': f'{code}. {description}'
+    }
 
-    it should raise an AuthError if permissions are not included in the payload
-        !!NOTE check your RBAC settings in Auth0
-    it should raise an AuthError if the requested permission string is not in the payload permissions array
-    return true otherwise
-'''
-def check_permissions(permission, payload):
-    if permission not in payload['permissions']:
-        raise AuthError({
-            'success': False,
-            'error': 401,
-            'message': 'permission_denied. you do not have permissions'
-        }, 401)
 
 '''
-@TODO implement verify_decode_jwt(token) method
-    @INPUTS
-        token: a json web token (string)
-
-    it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
-    it should decode the payload from the token
-    it should validate the claims
-    return the decoded payload
+the Auth0 signing keys, kept by kid and refreshed in the background
+instead of being downloaded for every request
 
-    !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+auth0 does the verification (see auth0_flask at the root of the
+repository), the functions below are the ones the endpoints use
 '''
-def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
-    if 'kid' not in unverified_header:
-        raise AuthError({
-            'success': False,
-            'error': 401,
-            'message': 'invalid_header. Authorization malformed.'
-        }, 401)
-
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    if rsa_key:
-        try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
-
-            return payload
-
-        except jwt.ExpiredSignatureError:
-            raise AuthError({
-                'success': False,
-                'error': 401,
-                'message': 'token_expired. Token expired.'
-            }, 401)
-
-        except jwt.JWTClaimsError:
-            raise AuthError({
-                'success': False,
-                'error': 401,
-                'message': 'invalid_claims. Incorrect claims. Please, check the audience and issuer.'
-            }, 401)
-        except Exception:
-            raise AuthError({
-                'success': False,
-                'error': 400,
-                'message': 'invalid_header. Unable to parse authentication token.'
-            }, 400)
-    raise AuthError({
-                'success': False,
-                'error': 400,
-                'message': 'invalid_header. Unable to find the appropriate key.'
-            }, 400)
+jwks_cache = JWKSCache(JWKS_URL, background_refresh=JWKS_BACKGROUND_REFRESH)
+auth0 = Auth(AUTH0_DOMAIN, API_AUDIENCE, keys=jwks_cache,
+             algorithms=ALGORITHMS, permissions=PERMISSIONS,
+             token_cache_size=TOKEN_CACHE_SIZE, error_body=error_body)
 
+get_token_auth_header = auth0.get_token_auth_header
+check_permissions = auth0.check_permissions
+requirement = auth0.requirement
+verify_decode_jwt = auth0.verify_decode_jwt
 '''
-@TODO implement @requires_auth(permission) decorator method
-    @INPUTS
-        permission: string permission (i.e. 'post:drink')
-
-    it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
-    it should use the check_permissions method validate claims and check the requested permission
-    return the decorator which passes the decoded payload to the decorated method
+requires_auth('post:drinks', 'patch:drinks') needs both permissions,
+requires_auth(any_of=('patch:drinks', 'delete:drinks')) one of them,
+requires_auth() only a valid token
 '''
-def requires_auth(permission=''):
-    def requires_auth_decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            try:
-                token = get_token_auth_header()
-                payload = verify_decode_jwt(token)
-                check_permissions(permission, payload)
-            except AuthError as ae:
-                return json.dumps(ae.error), ae.status_code
-            return f(payload, *args, **kwargs)
-
-        return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+requires_auth = auth0.requires_auth
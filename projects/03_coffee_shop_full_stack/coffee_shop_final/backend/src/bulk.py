@@ -0,0 +1,222 @@
+from collections import Counter
+
+from sqlalchemy import exc, or_
+
+from .database.models import Drink, db
+
+'''
+Batch
+    the creates, updates and deletes of one POST /drinks/bulk request
+
+    {"create": [{"title": ..., "recipe": ...}, ...],
+     "update": [{"id": 1, "title": ..., "recipe": ...}, ...],
+     "delete": [2, 3, ...]}
+
+    apply() checks every item before writing anything: the drinks and
+    titles the batch refers to are loaded with a single query and the
+    title uniqueness is checked in memory, against the titles as they
+    are once the whole batch is applied. the batch is then applied in
+    one transaction, or not at all when any item fails, and the result
+    of every item is reported at the same position as in the request:
+    when the batch fails, the valid items are reported as skipped
+'''
+
+MAX_ITEMS = 500
+
+PERMISSIONS = {
+    'create': 'post:drinks',
+    'update': 'patch:drinks',
+    'delete': 'delete:drinks',
+}
+
+
+class BulkError(Exception):
+    pass
+
+
+def is_id(value):
+    # JSON true / false are bools, which are ints to isinstance
+    return type(value) is int
+
+
+def failure(status, message):
+    return {'success': False, 'error': status, 'message': message}
+
+
+class Batch:
+    def __init__(self, create, update, delete):
+        self.create = create
+        self.update = update
+        self.delete = delete
+
+    @classmethod
+    def parse(cls, body):
+        if not isinstance(body, dict):
+            raise BulkError('the body must be a JSON object')
+        items = {op: body.get(op) or [] for op in PERMISSIONS}
+        if not all(isinstance(value, list) for value in items.values()):
+            raise BulkError('create, update and delete must be lists')
+        if not any(items.values()):
+            raise BulkError('the batch is empty')
+        if sum(len(value) for value in items.values()) > MAX_ITEMS:
+            raise BulkError(f'at most {MAX_ITEMS} items per batch')
+        # deletes may be ids or {"id": id}
+        items['delete'] = [item.get('id') if isinstance(item, dict) else item
+                           for item in items['delete']]
+        return cls(items['create'], items['update'], items['delete'])
+
+    def permissions(self):
+        '''the permissions the operations of the batch need'''
+        return [permission for op, permission in PERMISSIONS.items()
+                if getattr(self, op)]
+
+    def load(self):
+        '''{id: drink} and {title: drink} of the drinks the batch refers to'''
+        ids = {item.get('id') for item in self.update
+               if isinstance(item, dict)} | set(self.delete)
+        ids = {drink_id for drink_id in ids if is_id(drink_id)}
+        titles = {item.get('title') for item in self.create + self.update
+                  if isinstance(item, dict)}
+        titles = {title for title in titles if isinstance(title, str)}
+
+        conditions = []
+        if ids:
+            conditions.append(Drink.id.in_(ids))
+        if titles:
+            conditions.append(Drink.title.in_(titles))
+        drinks = Drink.query.filter(or_(*conditions)).all() \
+            if conditions else []
+        return ({drink.id: drink for drink in drinks},
+                {drink.title: drink for drink in drinks})
+
+    def check(self):
+        '''
+        (results, changes): the result of every item, None for the items
+        that may be applied, and the drinks to delete, update and create
+        '''
+        by_id, by_title = self.load()
+        results = {op: [None] * len(getattr(self, op)) for op in PERMISSIONS}
+        seen_ids = set()
+        deleted, updated, created = [], [], []
+        # (op, position, title, drink id or None) of every title the
+        # batch gives, checked once all the items are known
+        claims = []
+
+        for i, drink_id in enumerate(self.delete):
+            if not is_id(drink_id) or drink_id not in by_id:
+                results['delete'][i] = failure(404, 'resource not found')
+            elif drink_id in seen_ids:
+                results['delete'][i] = failure(400, 'drink listed twice')
+            else:
+                seen_ids.add(drink_id)
+                deleted.append(by_id[drink_id])
+
+        for i, item in enumerate(self.update):
+            drink_id = item.get('id') if isinstance(item, dict) else None
+            if not is_id(drink_id) or drink_id not in by_id:
+                results['update'][i] = failure(404, 'resource not found')
+                continue
+            if drink_id in seen_ids:
+                results['update'][i] = failure(400, 'drink listed twice')
+                continue
+            seen_ids.add(drink_id)
+            drink = by_id[drink_id]
+            if 'title' in item and not isinstance(item['title'], str):
+                results['update'][i] = failure(400, 'title must be a string')
+                continue
+            try:
+                if 'recipe' in item:
+                    Drink.validate_recipe(drink, 'recipe', item['recipe'])
+            except (ValueError, TypeError):
+                results['update'][i] = failure(400, 'invalid recipe')
+                continue
+            if 'title' in item:
+                claims.append(('update', i, item['title'], drink_id))
+            updated.append((drink, item))
+
+        for i, item in enumerate(self.create):
+            if not isinstance(item, dict) or 'title' not in item or \
+                    'recipe' not in item:
+                results['create'][i] = failure(
+                    400, 'title and recipe are required')
+                continue
+            if not isinstance(item['title'], str):
+                results['create'][i] = failure(400, 'title must be a string')
+                continue
+            try:
+                created.append(Drink(title=item['title'],
+                                     recipe=item['recipe']))
+            except (ValueError, TypeError):
+                results['create'][i] = failure(400, 'invalid recipe')
+                continue
+            claims.append(('create', i, item['title'], None))
+
+        # uniqueness holds on the titles the drinks have after the batch:
+        # deleted and renamed drinks give their titles up, so swaps and
+        # renames into a freed title are fine
+        released = {drink.id for drink in deleted} | \
+            {drink_id for _, _, _, drink_id in claims if drink_id is not None}
+        claimed = Counter(title for _, _, title, _ in claims)
+        for op, i, title, drink_id in claims:
+            owner = by_title.get(title)
+            if claimed[title] > 1:
+                results[op][i] = failure(409, 'title used twice in the batch')
+            elif owner is not None and owner.id != drink_id and \
+                    owner.id not in released:
+                results[op][i] = failure(409, 'title already exists')
+
+        return results, (deleted, updated, created)
+
+    def apply(self):
+        '''(success, results by operation)'''
+        results, (deleted, updated, created) = self.check()
+        if any(result is not None
+               for op in results.values() for result in op):
+            db.session.rollback()
+            for op in results.values():
+                op[:] = [result or {'success': False, 'skipped': True}
+                         for result in op]
+            return False, results
+
+        try:
+            # deletes first, so their titles may be reused by the batch
+            for drink in deleted:
+                db.session.delete(drink)
+            db.session.flush()
+            # the renamed drinks whose title another drink of the batch
+            # takes (a swap, a chain of renames) step aside under a
+            # placeholder title first, the unique index is checked on
+            # every row
+            taken = {item['title'] for _, item in updated if 'title' in item}
+            stepping_aside = [drink for drink, item in updated
+                              if 'title' in item and drink.title in taken and
+                              item['title'] != drink.title]
+            for drink in stepping_aside:
+                drink.title = f'~bulk rename {drink.id}'
+            if stepping_aside:
+                db.session.flush()
+            for drink, item in updated:
+                if 'title' in item:
+                    drink.title = item['title']
+                if 'recipe' in item:
+                    drink.recipe = item['recipe']
+            db.session.add_all(created)
+            db.session.flush()
+
+            # serialized before the commit expires the drinks, which
+            # would load every one of them again
+            results['delete'] = [{'success': True, 'delete': drink_id}
+                                 for drink_id in self.delete]
+            results['update'] = [{'success': True, 'drink': drink.long()}
+                                 for drink, _ in updated]
+            results['create'] = [{'success': True, 'drink': drink.long()}
+                                 for drink in created]
+            db.session.commit()
+        except exc.IntegrityError:
+            # a concurrent request took one of the titles
+            db.session.rollback()
+            for op in results.values():
+                op[:] = [failure(409, 'conflicting write, nothing applied')
+                         for _ in op]
+            return False, results
+        return True, results
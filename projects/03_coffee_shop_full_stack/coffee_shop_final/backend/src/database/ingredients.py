@@ -0,0 +1,83 @@
+from sqlalchemy import func, inspect
+from sqlalchemy.event import listens_for
+
+from .models import Drink, DrinkIngredient, db
+
+'''
+the ingredient index of the drinks (drink_ingredient), rewritten for a
+drink whenever it is inserted, its recipe is replaced or it is deleted,
+in the same transaction as the drink itself
+
+    search_drinks(ingredients, title)
+        the drinks having every ingredient of the list (case insensitive
+        names) whose title contains title, answered from the index and
+        the drink table without decoding any recipe
+    rebuild_index()
+        fills the index again from every recipe and returns the number
+        of rows, run by `flask rebuild-ingredients` (see api.py)
+'''
+
+
+def normalize(name):
+    return name.strip().lower() if isinstance(name, str) else ''
+
+
+def index_rows(drink_id, recipe):
+    names = {normalize(ingredient.get('name')) for ingredient in recipe or ()
+             if isinstance(ingredient, dict)}
+    return [{'drink_id': drink_id, 'name': name}
+            for name in sorted(names) if name]
+
+
+def index_drink(connection, drink_id, recipe):
+    table = DrinkIngredient.__table__
+    connection.execute(table.delete().where(table.c.drink_id == drink_id))
+    rows = index_rows(drink_id, recipe)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def rebuild_index(connection=None):
+    connection = connection or db.session.connection()
+    table = DrinkIngredient.__table__
+    connection.execute(table.delete())
+    rows = [row for drink_id, recipe
+            in connection.execute(db.select([Drink.id, Drink.recipe]))
+            for row in index_rows(drink_id, recipe)]
+    if rows:
+        connection.execute(table.insert(), rows)
+    return len(rows)
+
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_drinks(ingredients=(), title=None):
+    query = Drink.query
+    names = {normalize(name) for name in ingredients} - {''}
+    if names:
+        # drinks with a row for every one of the names
+        matching = db.session.query(DrinkIngredient.drink_id) \
+            .filter(DrinkIngredient.name.in_(names)) \
+            .group_by(DrinkIngredient.drink_id) \
+            .having(func.count(DrinkIngredient.name) == len(names))
+        query = query.filter(Drink.id.in_(matching.subquery()))
+    if title:
+        query = query.filter(Drink.title.ilike(
+            '%' + escape_like(title) + '%', escape='\\'))
+    return query.order_by(Drink.id).all()
+
+
+@listens_for(Drink, 'after_insert')
+def _index_insert(mapper, connection, target):
+    index_drink(connection, target.id, target.recipe)
+
+@listens_for(Drink, 'after_update')
+def _index_update(mapper, connection, target):
+    if inspect(target).attrs.recipe.history.has_changes():
+        index_drink(connection, target.id, target.recipe)
+
+@listens_for(Drink, 'before_delete')
+def _index_delete(mapper, connection, target):
+    index_drink(connection, target.id, ())
@@ -1,23 +1,83 @@
 import os
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, ForeignKey, String, Integer, JSON, event
+from sqlalchemy.orm import validates
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from sqlalchemy.pool import QueuePool
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
 
+'''
+the database is chosen from the environment
+    DATABASE_URL        sqlite:///path.db or postgresql://user:pw@host/db,
+                        the SQLite file beside this module by default
+    DB_POOL_SIZE        connections kept open per process (5)
+    DB_MAX_OVERFLOW     extra connections opened under load (10)
+    SQLITE_JOURNAL_MODE WAL by default, so reads go on while a write
+                        commits, DELETE is the former SQLite behaviour
+
+SQLite suits a single process, PostgreSQL is the one to use when several
+gunicorn workers share the database
+'''
+SQLITE_PRAGMAS = (
+    ('journal_mode', os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')),
+    # with WAL, NORMAL only syncs at checkpoints and stays consistent
+    ('synchronous', 'NORMAL'),
+    # writers wait for the lock instead of failing with "database is locked"
+    ('busy_timeout', '5000'),
+    ('foreign_keys', 'ON'),
+    ('temp_store', 'MEMORY'),
+)
+
+
+def database_url():
+    url = os.environ.get('DATABASE_URL', database_path)
+    # Heroku style URLs
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    pool = {
+        'poolclass': QueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    }
+    if url.startswith('sqlite'):
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            # every connection would get its own empty database
+            return {}
+        return dict(pool, connect_args={'check_same_thread': False})
+    # drop connections the server closed while idle in the pool
+    return dict(pool, pool_pre_ping=True, pool_recycle=1800)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
 def setup_db(app):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+    url = database_url()
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(url)
     db.app = app
     db.init_app(app)
+    if url.startswith('sqlite'):
+        event.listen(db.get_engine(app), 'connect', set_sqlite_pragmas)
 
 '''
 db_drop_and_create_all()
@@ -28,6 +88,16 @@ db_drop_and_create_all()
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    db.session.add(MenuVersion(id=MenuVersion.ROW_ID, version=0))
+    db.session.commit()
+
+'''
+short_recipe(recipe)
+    the color and parts of every ingredient of a recipe, what the short
+    form of a drink shows
+'''
+def short_recipe(recipe):
+    return [{'color': r['color'], 'parts': r['parts']} for r in recipe]
 
 '''
 Drink
@@ -38,21 +108,48 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients - a JSON column, decoded once when the row is loaded
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # (see migrations/001_recipe_json.sql for databases created with the
+    # former VARCHAR(180) column)
+    recipe = Column(JSON, nullable=False)
+
+    '''
+    recipe validation
+        accepts the recipe as a list of ingredients, a single ingredient
+        or its JSON text, and stores it as a list of ingredients
+    '''
+    @validates('recipe')
+    def validate_recipe(self, key, recipe):
+        if isinstance(recipe, str):
+            recipe = json.loads(recipe)
+        if isinstance(recipe, dict):
+            recipe = [recipe]
+        if not isinstance(recipe, list) or \
+                not all(isinstance(r, dict) for r in recipe):
+            raise ValueError('recipe must be a list of ingredients')
+        return recipe
+
+    '''
+    short_recipe()
+        the color and parts of every ingredient, built once per loaded
+        recipe and kept on the instance
+    '''
+    def short_recipe(self):
+        cached = self.__dict__.get('_short_recipe')
+        if cached is None:
+            cached = self._short_recipe = short_recipe(self.recipe)
+        return cached
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.short_recipe()
         }
 
     '''
@@ -63,7 +160,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe
         }
 
     '''
@@ -104,4 +201,48 @@ class Drink(db.Model):
         db.session.commit()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return f'<Drink {self.id} {self.title!r}>'
+
+
+'''
+the short recipe kept on an instance is dropped whenever its recipe is
+replaced, expired (after a commit) or loaded again
+'''
+@event.listens_for(Drink.recipe, 'set')
+def reset_short_recipe(target, value, oldvalue, initiator):
+    target.__dict__.pop('_short_recipe', None)
+
+
+@event.listens_for(Drink, 'expire')
+@event.listens_for(Drink, 'refresh')
+def reset_short_recipe_on_load(target, *args):
+    target.__dict__.pop('_short_recipe', None)
+
+
+'''
+DrinkIngredient
+    the ingredient index: one row per drink and ingredient name, the name
+    lower cased, kept up to date with the recipes (see ingredients.py)
+    so drinks are found by ingredient without decoding their recipes.
+    the names are unbounded like the recipes they come from
+'''
+class DrinkIngredient(db.Model):
+    __tablename__ = 'drink_ingredient'
+
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'),
+                      primary_key=True)
+    name = Column(String, primary_key=True, index=True)
+
+
+'''
+MenuVersion
+    a single row counting the writes to the drinks, bumped in the same
+    transaction as every write (see menu.py) so each worker process can
+    tell with one primary key lookup whether its cached menu is current
+'''
+class MenuVersion(db.Model):
+    __tablename__ = 'menu_version'
+    ROW_ID = 1
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,194 @@
+import base64
+import binascii
+import hashlib
+import json
+import threading
+
+from sqlalchemy.event import listens_for
+from sqlalchemy.orm import Session
+
+from .database.models import Drink, MenuVersion, short_recipe
+
+'''
+MenuCache
+    the JSON bodies of GET /drinks and GET /drinks-detail, serialized once
+    and served as bytes until the menu changes
+
+    get(form)
+        (body, etag) of the 'short' or 'long' menu, built from the
+        database on first use and again whenever version() differs from
+        the version the menu was built at
+    rebuild()
+        loads the drinks once and serializes both forms again, called by
+        the endpoints that write drinks right after their commit
+
+    version() is read on every get(), so with several workers a write
+    handled by one of them reaches the menus of all the others: here
+    the menu_version row, bumped in the transaction of every drink write
+'''
+
+FORMS = ('short', 'long')
+
+
+class MenuCache:
+    def __init__(self, load, version=None):
+        # load() returns the drinks of the menu, version() a value that
+        # changes whenever they change (None: only rebuild() changes it)
+        self.load = load
+        self.version = version or (lambda: None)
+        self.hits = 0
+        self.rebuilds = 0
+        # (version, {form: (body, etag)})
+        self._menus = None
+        self._lock = threading.Lock()
+
+    def _serialize(self, drinks):
+        menus = {}
+        for form in FORMS:
+            body = json.dumps({
+                'success': True,
+                'drinks': [getattr(drink, form)() for drink in drinks]
+            }, separators=(',', ':')).encode('utf-8')
+            menus[form] = (body, hashlib.sha1(body).hexdigest())
+        return menus
+
+    def _build(self, version):
+        # the version is read before the drinks, a write in between
+        # only makes the next get() build again
+        self._menus = (version, self._serialize(self.load()))
+        self.rebuilds += 1
+
+    def rebuild(self):
+        with self._lock:
+            self._build(self.version())
+
+    def invalidate(self):
+        with self._lock:
+            self._menus = None
+
+    def get(self, form):
+        version = self.version()
+        menus = self._menus
+        if menus is not None and menus[0] == version:
+            self.hits += 1
+            return menus[1][form]
+        # requests arriving during the build wait for it
+        with self._lock:
+            if self._menus is None or self._menus[0] != version:
+                self._build(version)
+            return self._menus[1][form]
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'rebuilds': self.rebuilds
+        }
+
+
+'''
+menu_version(session)
+    the version of the menu_version row, None before the first write
+
+the row is bumped once per flush that writes drinks, in the same
+transaction, so a rolled back write leaves it as it was
+'''
+def menu_version(session):
+    return session.query(MenuVersion.version) \
+        .filter(MenuVersion.id == MenuVersion.ROW_ID).scalar()
+
+
+def bump_menu_version(connection):
+    table = MenuVersion.__table__
+    result = connection.execute(
+        table.update().where(table.c.id == MenuVersion.ROW_ID)
+        .values(version=table.c.version + 1))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=MenuVersion.ROW_ID,
+                                                 version=1))
+
+
+@listens_for(Session, 'after_flush')
+def _bump_on_drink_writes(session, flush_context):
+    # new, dirty and deleted still hold what the flush wrote
+    if any(isinstance(instance, Drink) for instance in
+           session.new | session.dirty | session.deleted):
+        bump_menu_version(session.connection())
+
+
+'''
+drinks_page(session, form, fields, after, limit)
+    one page of the menu read straight from the database, for requests
+    with ?cursor=, ?limit= or ?fields=: only the columns of the
+    requested fields are selected and no Drink instance is built
+
+    pages are ordered by id, the cursor of the next page encodes the last
+    id of the page (keyset pagination: every page costs the same however
+    far the client went)
+'''
+FIELDS = ('id', 'title', 'recipe')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class PageError(Exception):
+    pass
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(
+        json.dumps({'after': last_id}).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        after = after['after']
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise PageError('invalid cursor')
+    if type(after) is not int:
+        raise PageError('invalid cursor')
+    return after
+
+
+def parse_fields(fields):
+    '''the requested fields in FIELDS order, id always included'''
+    if not fields:
+        return FIELDS
+    names = {name.strip() for name in fields.split(',')} - {''}
+    if not names or not names <= set(FIELDS):
+        raise PageError('fields must be among ' + ', '.join(FIELDS))
+    return tuple(name for name in FIELDS if name in names or name == 'id')
+
+
+def parse_limit(limit):
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PageError('invalid limit')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise PageError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return limit
+
+
+def drinks_page(session, form, fields=FIELDS, after=None, limit=None):
+    '''(drinks, last id) of the page, last id is None on the last page'''
+    columns = [getattr(Drink, name) for name in fields]
+    query = session.query(*columns).order_by(Drink.id)
+    if after is not None:
+        query = query.filter(Drink.id > after)
+    if limit is not None:
+        # one more row tells whether there is a next page
+        query = query.limit(limit + 1)
+    rows = query.all()
+
+    more = limit is not None and len(rows) > limit
+    rows = rows[:limit] if more else rows
+    drinks = []
+    for row in rows:
+        drink = dict(zip(fields, row))
+        if form == 'short' and 'recipe' in drink:
+            drink['recipe'] = short_recipe(drink['recipe'])
+        drinks.append(drink)
+    return drinks, (rows[-1].id if more else None)
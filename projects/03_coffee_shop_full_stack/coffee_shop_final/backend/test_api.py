@@ -0,0 +1,525 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from auth0_flask import StaticKeys
+from auth0_flask.testing import SigningKey
+
+# the app binds the database of the environment when it is imported,
+# and never reaches Auth0: its key set is replaced by a local key below
+fd, DATABASE_PATH = tempfile.mkstemp(suffix='.db', prefix='coffee_test_')
+os.close(fd)
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE_PATH
+os.environ['AUTH0_JWKS_URL'] = 'http://127.0.0.1:9/.well-known/jwks.json'
+os.environ['AUTH0_JWKS_BACKGROUND_REFRESH'] = '0'
+
+from src.api import app, menu  # noqa: E402
+from src.menu import MenuCache, encode_cursor, menu_version  # noqa: E402
+from src.auth import auth  # noqa: E402
+from src.database.models import Drink, db, db_drop_and_create_all, \
+    database_path, database_url, engine_options  # noqa: E402
+
+key = None
+
+
+def setUpModule():
+    global key
+    key = SigningKey()
+    auth.auth0.keys = StaticKeys({key.kid: key.jwk()})
+
+
+def tearDownModule():
+    with app.app_context():
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DATABASE_PATH + suffix):
+            os.remove(DATABASE_PATH + suffix)
+
+
+def recipe(name='coffee'):
+    return [{'name': name, 'color': 'brown', 'parts': 1}]
+
+
+class DatabaseSetupTestCase(unittest.TestCase):
+    """Tests for the database URL, engine options and SQLite pragmas"""
+
+    def test_database_url(self):
+        with mock.patch.dict(os.environ):
+            del os.environ['DATABASE_URL']
+            self.assertEqual(database_url(), database_path)
+            os.environ['DATABASE_URL'] = 'postgres://coffee:pw@db/coffee'
+            self.assertEqual(database_url(), 'postgresql://coffee:pw@db/coffee')
+            os.environ['DATABASE_URL'] = 'postgresql://coffee:pw@db/coffee'
+            self.assertEqual(database_url(), 'postgresql://coffee:pw@db/coffee')
+
+    def test_engine_options(self):
+        with mock.patch.dict(os.environ, {'DB_POOL_SIZE': '8',
+                                          'DB_MAX_OVERFLOW': '2'}):
+            options = engine_options('postgresql://coffee:pw@db/coffee')
+            self.assertEqual(options['pool_size'], 8)
+            self.assertEqual(options['max_overflow'], 2)
+            self.assertTrue(options['pool_pre_ping'])
+            self.assertEqual(options['pool_recycle'], 1800)
+
+            options = engine_options(database_path)
+            self.assertEqual(options['pool_size'], 8)
+            self.assertEqual(options['connect_args'],
+                             {'check_same_thread': False})
+            self.assertNotIn('pool_pre_ping', options)
+
+        # an in-memory database must keep its single connection
+        self.assertEqual(engine_options('sqlite://'), {})
+        self.assertEqual(engine_options('sqlite:///:memory:'), {})
+
+    def test_setup_db(self):
+        # src.api ran setup_db with the DATABASE_URL set above
+        self.assertEqual(app.config['SQLALCHEMY_DATABASE_URI'],
+                         'sqlite:///' + DATABASE_PATH)
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS'],
+                         engine_options('sqlite:///' + DATABASE_PATH))
+        with app.app_context():
+            pragmas = {name: db.session.execute(f'PRAGMA {name}').scalar()
+                       for name in ('journal_mode', 'synchronous',
+                                    'busy_timeout', 'foreign_keys',
+                                    'temp_store')}
+            db.session.remove()
+        # synchronous NORMAL = 1, temp_store MEMORY = 2
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1,
+                                   'busy_timeout': 5000, 'foreign_keys': 1,
+                                   'temp_store': 2})
+
+
+class BulkTestCase(unittest.TestCase):
+    """Tests for POST /drinks/bulk"""
+
+    def setUp(self):
+        self.client = app.test_client
+        with app.app_context():
+            db_drop_and_create_all()
+            db.session.add_all([Drink(title=title, recipe=recipe())
+                                for title in ('Latte', 'Mocha', 'Espresso')])
+            db.session.commit()
+            self.ids = {drink.title: drink.id for drink in Drink.query}
+            db.session.remove()
+        menu.invalidate()
+
+    def headers(self, *permissions):
+        token = key.token(auth.auth0, permissions)
+        return {'Authorization': 'Bearer ' + token}
+
+    def bulk(self, batch, permissions=('post:drinks', 'patch:drinks',
+                                       'delete:drinks')):
+        return self.client().post('/drinks/bulk', json=batch,
+                                  headers=self.headers(*permissions))
+
+    def titles(self):
+        with app.app_context():
+            titles = sorted(drink.title for drink in Drink.query)
+            db.session.remove()
+        return titles
+
+    def test_bulk(self):
+        res = self.bulk({
+            'create': [{'title': 'Flat white', 'recipe': recipe('milk')}],
+            'update': [{'id': self.ids['Mocha'], 'title': 'Cafe mocha'}],
+            'delete': [self.ids['Espresso']]
+        })
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['create'][0]['drink']['title'], 'Flat white')
+        self.assertEqual(data['update'][0]['drink']['title'], 'Cafe mocha')
+        self.assertEqual(data['delete'],
+                         [{'success': True, 'delete': self.ids['Espresso']}])
+        self.assertEqual(self.titles(), ['Cafe mocha', 'Flat white', 'Latte'])
+
+        # the cached menu follows
+        titles = [drink['title'] for drink in
+                  self.client().get('/drinks').get_json()['drinks']]
+        self.assertEqual(sorted(titles), self.titles())
+
+    def test_bulk_all_or_nothing(self):
+        res = self.bulk({
+            'create': [{'title': 'Flat white', 'recipe': recipe()}],
+            'update': [{'id': 1000, 'title': 'Unknown'}],
+            'delete': [self.ids['Latte']]
+        })
+        data = res.get_json()
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['update'][0]['error'], 404)
+        # valid items are not reported as applied
+        skipped = {'success': False, 'skipped': True}
+        self.assertEqual(data['create'], [skipped])
+        self.assertEqual(data['delete'], [skipped])
+        self.assertEqual(self.titles(), ['Espresso', 'Latte', 'Mocha'])
+
+    def test_bulk_duplicate_ids(self):
+        latte = self.ids['Latte']
+        res = self.bulk({'delete': [latte, latte]})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['delete'][0], {'success': False,
+                                             'skipped': True})
+        self.assertEqual(data['delete'][1]['error'], 400)
+
+        # a drink both updated and deleted
+        res = self.bulk({'update': [{'id': latte, 'title': 'Iced latte'}],
+                         'delete': [latte]})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['update'][0]['error'], 400)
+        self.assertEqual(self.titles(), ['Espresso', 'Latte', 'Mocha'])
+
+    def test_bulk_title_used_twice(self):
+        res = self.bulk({'create': [
+            {'title': 'Flat white', 'recipe': recipe()},
+            {'title': 'Flat white', 'recipe': recipe('milk')}]})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['create'][1]['error'], 409)
+
+        # taken by a drink the batch does not delete
+        res = self.bulk({'update': [{'id': self.ids['Mocha'],
+                                     'title': 'Latte'}]})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(res.get_json()['update'][0]['error'], 409)
+        self.assertEqual(self.titles(), ['Espresso', 'Latte', 'Mocha'])
+
+    def test_bulk_renames(self):
+        # uniqueness holds on the titles after the batch: a swap and a
+        # chain of renames
+        res = self.bulk({'update': [
+            {'id': self.ids['Latte'], 'title': 'Mocha'},
+            {'id': self.ids['Mocha'], 'title': 'Espresso'},
+            {'id': self.ids['Espresso'], 'title': 'Latte'}]})
+        self.assertEqual(res.status_code, 200)
+        with app.app_context():
+            titles = {drink.id: drink.title for drink in Drink.query}
+            db.session.remove()
+        self.assertEqual(titles[self.ids['Latte']], 'Mocha')
+        self.assertEqual(titles[self.ids['Mocha']], 'Espresso')
+        self.assertEqual(titles[self.ids['Espresso']], 'Latte')
+
+        # a renamed drink gives its title up
+        res = self.bulk({
+            'update': [{'id': self.ids['Espresso'], 'title': 'Iced latte'}],
+            'create': [{'title': 'Latte', 'recipe': recipe('milk')}]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.titles(),
+                         ['Espresso', 'Iced latte', 'Latte', 'Mocha'])
+
+        # two drinks cannot end with the same title
+        res = self.bulk({'update': [
+            {'id': self.ids['Latte'], 'title': 'Cortado'},
+            {'id': self.ids['Mocha'], 'title': 'Cortado'}]})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual([item.get('error') for item
+                          in res.get_json()['update']], [409, 409])
+
+    def test_bulk_bool_ids(self):
+        # JSON true is not the drink with id 1
+        self.assertEqual(self.ids['Latte'], 1)
+        res = self.bulk({'delete': [True],
+                         'update': [{'id': True, 'title': 'Iced latte'}]})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['delete'][0]['error'], 404)
+        self.assertEqual(data['update'][0]['error'], 404)
+        self.assertEqual(self.titles(), ['Espresso', 'Latte', 'Mocha'])
+
+    def test_bulk_title_freed_by_delete(self):
+        res = self.bulk({
+            'delete': [self.ids['Latte']],
+            'create': [{'title': 'Latte', 'recipe': recipe('milk')}],
+            'update': [{'id': self.ids['Mocha'], 'title': 'Latte'}]})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(res.get_json()['create'][0]['error'], 409)
+
+        res = self.bulk({
+            'delete': [self.ids['Latte']],
+            'create': [{'title': 'Latte', 'recipe': recipe('milk')}]})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(data['create'][0]['drink']['id'],
+                            self.ids['Latte'])
+        self.assertEqual(self.titles(), ['Espresso', 'Latte', 'Mocha'])
+
+    def test_bulk_mixed_permissions(self):
+        batch = {'create': [{'title': 'Flat white', 'recipe': recipe()}],
+                 'delete': [self.ids['Latte']]}
+        # every operation of the batch needs its permission
+        res = self.bulk(batch, permissions=('post:drinks',))
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.get_json()['success'], False)
+        res = self.bulk(batch, permissions=('get:drinks-detail',))
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(self.titles(), ['Espresso', 'Latte', 'Mocha'])
+
+        res = self.bulk(batch, permissions=('post:drinks', 'delete:drinks'))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.titles(), ['Espresso', 'Flat white', 'Mocha'])
+
+    def test_error_bulk(self):
+        for batch in ({}, [], {'create': {}}, {'delete': []}):
+            res = self.bulk(batch)
+            self.assertEqual(res.status_code, 400)
+        res = self.client().post('/drinks/bulk', json={'delete': [1]})
+        self.assertEqual(res.status_code, 401)
+
+
+class MenuCacheTestCase(unittest.TestCase):
+    """Tests for the cached menus of GET /drinks and GET /drinks-detail"""
+
+    def setUp(self):
+        self.client = app.test_client
+        with app.app_context():
+            db_drop_and_create_all()
+            db.session.add(Drink(title='Latte', recipe=recipe('milk')))
+            db.session.commit()
+            self.latte = Drink.query.one().id
+            db.session.remove()
+        menu.invalidate()
+
+    def headers(self, *permissions):
+        return {'Authorization': 'Bearer ' + key.token(auth.auth0,
+                                                       permissions)}
+
+    def titles(self):
+        res = self.client().get('/drinks')
+        self.assertEqual(res.status_code, 200)
+        return sorted(drink['title'] for drink in res.get_json()['drinks'])
+
+    def test_etag(self):
+        res = self.client().get('/drinks')
+        etag = res.headers['ETag']
+        self.assertEqual(res.headers['Cache-Control'], 'no-cache')
+
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.get_data(), b'')
+
+        # the detail has its own ETag
+        res = self.client().get('/drinks-detail',
+                                headers=dict(self.headers('get:drinks-detail'),
+                                             **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Cache-Control'], 'private, no-cache')
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+        # a changed menu is sent again
+        self.client().post('/drinks', headers=self.headers('post:drinks'),
+                           json={'title': 'Mocha', 'recipe': recipe()})
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_writes_rebuild_the_menu(self):
+        self.assertEqual(self.titles(), ['Latte'])
+
+        res = self.client().post('/drinks', headers=self.headers('post:drinks'),
+                                 json={'title': 'Mocha', 'recipe': recipe()})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.titles(), ['Latte', 'Mocha'])
+
+        res = self.client().patch('/drinks/%d' % self.latte,
+                                  headers=self.headers('patch:drinks'),
+                                  json={'title': 'Iced latte'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.titles(), ['Iced latte', 'Mocha'])
+
+        res = self.client().delete('/drinks/%d' % self.latte,
+                                   headers=self.headers('delete:drinks'))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.titles(), ['Mocha'])
+
+    def test_menu_version_reaches_other_caches(self):
+        # another worker: its own MenuCache over the same database
+        with app.app_context():
+            other = MenuCache(lambda: Drink.query.all(),
+                              lambda: menu_version(db.session))
+            body, etag = other.get('short')
+            self.assertEqual(other.get('short'), (body, etag))
+            self.assertEqual(other.stats(), {'hits': 1, 'rebuilds': 1})
+            db.session.remove()
+
+        # a write handled here bumps menu_version
+        self.client().post('/drinks', headers=self.headers('post:drinks'),
+                           json={'title': 'Mocha', 'recipe': recipe()})
+
+        with app.app_context():
+            new_body, new_etag = other.get('short')
+            self.assertNotEqual(new_etag, etag)
+            self.assertEqual(other.stats()['rebuilds'], 2)
+            self.assertEqual(
+                sorted(drink['title'] for drink
+                       in json.loads(new_body)['drinks']),
+                ['Latte', 'Mocha'])
+            db.session.remove()
+
+
+class MenuPageTestCase(unittest.TestCase):
+    """Tests for ?cursor=, ?limit= and ?fields= on the menu endpoints"""
+
+    def setUp(self):
+        self.client = app.test_client
+        with app.app_context():
+            db_drop_and_create_all()
+            db.session.add_all([Drink(title='Drink %02d' % i,
+                                      recipe=recipe('ingredient %d' % i))
+                                for i in range(7)])
+            db.session.commit()
+            self.ids = sorted(drink.id for drink in Drink.query)
+            db.session.remove()
+        menu.invalidate()
+        self.detail = {'Authorization': 'Bearer ' + key.token(
+            auth.auth0, ['get:drinks-detail'])}
+
+    def get(self, path, **headers):
+        res = self.client().get(path, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        return res.get_json()
+
+    def test_next_cursor(self):
+        for path, headers in (('/drinks', {}),
+                              ('/drinks-detail', self.detail)):
+            ids, url = [], path + '?limit=3'
+            while True:
+                data = self.get(url, **headers)
+                self.assertLessEqual(len(data['drinks']), 3)
+                ids += [drink['id'] for drink in data['drinks']]
+                if data['next_cursor'] is None:
+                    break
+                url = path + '?limit=3&cursor=' + data['next_cursor']
+            # every drink once, in id order, over three pages
+            self.assertEqual(ids, self.ids)
+            self.assertEqual(len(data['drinks']), 1)
+
+        # a cursor alone pages with the default size
+        data = self.get('/drinks?cursor=' + encode_cursor(self.ids[4]))
+        self.assertEqual([drink['id'] for drink in data['drinks']],
+                         self.ids[5:])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_fields(self):
+        data = self.get('/drinks?fields=title')
+        self.assertEqual(data['drinks'][0], {'id': self.ids[0],
+                                             'title': 'Drink 00'})
+        self.assertIsNone(data['next_cursor'])
+
+        # the short form keeps the color and parts of the recipe only
+        data = self.get('/drinks?fields=recipe,id&limit=1')
+        self.assertEqual(data['drinks'], [{
+            'id': self.ids[0],
+            'recipe': [{'color': 'brown', 'parts': 1}]}])
+        data = self.get('/drinks-detail?fields=recipe&limit=1',
+                        **self.detail)
+        self.assertEqual(data['drinks'][0]['recipe'], recipe('ingredient 0'))
+
+    def test_page_errors(self):
+        for query in ('cursor=abc', 'cursor=' + encode_cursor('1'),
+                      'cursor=' + encode_cursor(True), 'limit=0',
+                      'limit=501', 'limit=ten', 'fields=price',
+                      'fields=title,price', 'fields=,'):
+            res = self.client().get('/drinks?' + query)
+            self.assertEqual(res.status_code, 400, query)
+            self.assertEqual(res.get_json()['success'], False)
+
+
+class IngredientIndexTestCase(unittest.TestCase):
+    """Tests for GET /drinks/search and its ingredient index"""
+
+    def setUp(self):
+        self.client = app.test_client
+        with app.app_context():
+            db_drop_and_create_all()
+            db.session.remove()
+
+    def search(self, query):
+        res = self.client().get('/drinks/search' + query)
+        self.assertEqual(res.status_code, 200)
+        return [drink['title'] for drink in res.get_json()['drinks']]
+
+    def test_long_ingredient_names(self):
+        name = 'Steamed ' + 'oat ' * 40 + 'milk'
+        with app.app_context():
+            db.session.add(Drink(title='Long', recipe=recipe(name)))
+            db.session.commit()
+            db.session.remove()
+        self.assertEqual(self.search('?ingredient=' + name.upper()),
+                         ['Long'])
+        self.assertEqual(self.search('?ingredient=' + name[:80]), [])
+
+    def test_rebuild_ingredients_command(self):
+        with app.app_context():
+            db.session.add_all([Drink(title='Latte', recipe=recipe('milk')),
+                                Drink(title='Mocha', recipe=recipe())])
+            db.session.commit()
+            db.session.execute('DELETE FROM drink_ingredient')
+            db.session.commit()
+            db.session.remove()
+        self.assertEqual(self.search('?ingredient=milk'), [])
+
+        result = app.test_cli_runner().invoke(args=['rebuild-ingredients'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('2 rows', result.output)
+        self.assertEqual(self.search('?ingredient=milk'), ['Latte'])
+
+
+class DrinkModelTestCase(unittest.TestCase):
+    """Tests for the recipe validation and the cached short recipe"""
+
+    def setUp(self):
+        with app.app_context():
+            db_drop_and_create_all()
+            db.session.remove()
+
+    def test_recipe_forms(self):
+        ingredient = {'name': 'milk', 'color': 'white', 'parts': 2}
+        for value in ([ingredient], ingredient, json.dumps([ingredient]),
+                      json.dumps(ingredient)):
+            self.assertEqual(Drink(title='Latte', recipe=value).recipe,
+                             [ingredient])
+        self.assertEqual(Drink(title='Water', recipe=[]).recipe, [])
+
+    def test_invalid_recipes(self):
+        for value in (None, 5, 'milk', '"milk"', '[1]', [1],
+                      [{'name': 'milk'}, 'sugar'], [['milk', 'white', 2]]):
+            with self.assertRaises(ValueError):
+                Drink(title='Latte', recipe=value)
+
+        # rejected by POST /drinks
+        headers = {'Authorization': 'Bearer ' +
+                       key.token(auth.auth0, ['post:drinks'])}
+        res = app.test_client().post('/drinks', headers=headers, json={
+            'title': 'Latte', 'recipe': ['milk']})
+        self.assertEqual(res.status_code, 400)
+
+    def test_short_recipe_follows_the_recipe(self):
+        milk = {'name': 'milk', 'color': 'white', 'parts': 2}
+        with app.app_context():
+            drink = Drink(title='Latte', recipe=recipe())
+            self.assertEqual(drink.short()['recipe'],
+                             [{'color': 'brown', 'parts': 1}])
+            # reassigned
+            drink.recipe = [milk]
+            self.assertEqual(drink.short()['recipe'],
+                             [{'color': 'white', 'parts': 2}])
+
+            # expired by the commit, then written behind the session's back
+            drink.insert()
+            self.assertEqual(drink.short()['recipe'],
+                             [{'color': 'white', 'parts': 2}])
+            db.session.execute(Drink.__table__.update().values(
+                recipe=[dict(milk, color='beige')]))
+            db.session.commit()
+            self.assertEqual(drink.short()['recipe'],
+                             [{'color': 'beige', 'parts': 2}])
+            db.session.remove()
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()